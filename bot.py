@@ -1,8 +1,16 @@
 import discord.ext.commands as commands
 
+import database
+import network
 import discord
 import aiohttp
 import asyncpg
+import asyncio
+import logging
+import typing
+
+# How long to wait between attempts to re-establish the notification connection.
+RESUBSCRIBE_DELAY = 5.0
 
 class Bot(commands.Bot):
     """A minimally extended commands.Bot subclass."""
@@ -11,3 +19,80 @@ class Bot(commands.Bot):
         super().__init__(command_prefix="$", help_command=None, intents=discord.Intents.all())
         self.session = session
         self.pool = pool
+
+        # Backends should send requests through this instead of the session directly.
+        self.network = network.Client(session, network.DISK_PATH)
+
+        # A dedicated connection is required to receive notifications.
+        self.listener: asyncpg.Connection | None = None
+        self.resubscription: asyncio.Task | None = None
+        self.logger = logging.getLogger("bakerbot.bot")
+
+    async def setup_hook(self):
+        """Migrate the database, prune expired rows, warm caches and subscribe to database notifications."""
+        await database.migrate(self.pool)
+
+        # Extensions are loaded before this runs, so they can't touch tables a migration might create.
+        await database.WolframAnswer.prune(self.pool)
+        await database.WolframQuery.prune(self.pool)
+        await self.subscribe()
+        await database.GuildConfiguration.load(self.pool)
+
+    async def subscribe(self):
+        """Acquire a connection and listen for notifications on it."""
+        listener = typing.cast(asyncpg.Connection, await self.pool.acquire())
+
+        try:
+            listener.add_termination_listener(self.terminated)
+            await database.GuildConfiguration.listen(listener)
+        except BaseException:
+            listener.remove_termination_listener(self.terminated)
+            await self.pool.release(listener)
+            raise
+
+        self.listener = listener
+
+    def terminated(self, connection: asyncpg.Connection):
+        """Called when the notification connection is lost."""
+        # Any notifications sent while we're disconnected are lost, so nothing cached can be trusted.
+        database.GuildConfiguration.forget()
+        self.listener = None
+
+        if not self.is_closed() and self.resubscription is None:
+            self.resubscription = asyncio.create_task(self.resubscribe(connection))
+
+    async def resubscribe(self, connection: asyncpg.Connection):
+        """Keep trying to listen for notifications again."""
+        try:
+            # The pool replaces closed connections, but it still needs this one back.
+            try:
+                await self.pool.release(connection)
+            except Exception as error:
+                self.logger.warning(f"Failed to release the lost notification connection: {error}")
+
+            while not self.is_closed():
+                try:
+                    await self.subscribe()
+                except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as error:
+                    self.logger.warning(f"Failed to resubscribe to notifications: {error}")
+                    await asyncio.sleep(RESUBSCRIBE_DELAY)
+                else:
+                    # Anything cached while we were reconnecting may have missed a notification too.
+                    database.GuildConfiguration.forget()
+                    self.logger.info("Resubscribed to notifications.")
+                    break
+        finally:
+            self.resubscription = None
+
+    async def close(self):
+        """Close the bot, release the notification connection and close the HTTP cache."""
+        await super().close()
+        self.network.close()
+
+        if self.resubscription is not None:
+            self.resubscription.cancel()
+
+        if self.listener is not None:
+            self.listener.remove_termination_listener(self.terminated)
+            await self.pool.release(self.listener)
+            self.listener = None
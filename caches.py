@@ -0,0 +1,108 @@
+import dataclasses
+import collections
+import asyncio
+import typing
+import math
+import time
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+# Distinguishes a cache miss from a cached None.
+MISSING = object()
+
+@dataclasses.dataclass
+class Statistics:
+    """Hit and miss counters for a cache."""
+    name: str
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def ratio(self) -> float:
+        """The proportion of lookups that were served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+REGISTRY: dict[str, Statistics] = {}
+
+def statistics(name: str) -> Statistics:
+    """Get (or create) the statistics for a named cache."""
+    if name not in REGISTRY:
+        REGISTRY[name] = Statistics(name)
+
+    return REGISTRY[name]
+
+class LRU(typing.Generic[K, V]):
+    """A bounded mapping that evicts the least recently used entry (and optionally expires entries)."""
+    def __init__(self, capacity: int, statistics: Statistics | None = None, lifetime: float | None = None, weigh: typing.Callable[[V], int] | None = None):
+        # The capacity is in units of `weigh` (entries by default, but bytes work too).
+        self.capacity = capacity
+        self.statistics = statistics
+        self.lifetime = lifetime
+        self.weigh = weigh or (lambda _: 1)
+        self.weight = 0
+        self.entries: collections.OrderedDict[K, tuple[float, V]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.entries and self.entries[key][0] > time.monotonic() # type: ignore
+
+    def __setitem__(self, key: K, value: V):
+        self.put(key, value)
+
+    def put(self, key: K, value: V, lifetime: float | None = None):
+        """Insert a value that expires after `lifetime` seconds (or the default lifetime)."""
+        lifetime = lifetime if lifetime is not None else self.lifetime
+        deadline = time.monotonic() + lifetime if lifetime is not None else math.inf
+
+        self.pop(key)
+        self.entries[key] = (deadline, value)
+        self.weight += self.weigh(value)
+
+        while self.weight > self.capacity and self.entries:
+            self.pop(next(iter(self.entries)))
+
+    def get(self, key: K, default: typing.Any = None) -> V | typing.Any:
+        """Return the value for `key` (marking it as recently used) or `default`."""
+        if key not in self:
+            self.pop(key)
+
+            if self.statistics is not None:
+                self.statistics.misses += 1
+
+            return default
+
+        if self.statistics is not None:
+            self.statistics.hits += 1
+
+        self.entries.move_to_end(key)
+        return self.entries[key][1]
+
+    def pop(self, key: K, default: typing.Any = None) -> V | typing.Any:
+        """Remove and return the value for `key`, or `default` if it isn't present."""
+        if (entry := self.entries.pop(key, None)) is not None:
+            self.weight -= self.weigh(entry[1])
+            return entry[1]
+
+        return default
+
+class Flights(typing.Generic[K, V]):
+    """Deduplicates concurrent calls that share the same key."""
+    def __init__(self):
+        self.futures: dict[K, asyncio.Future[V]] = {}
+
+    def __len__(self) -> int:
+        return len(self.futures)
+
+    async def run(self, key: K, factory: typing.Callable[[], typing.Awaitable[V]]) -> V:
+        """Await `factory()`, or the call already in flight for `key` if there is one."""
+        if key not in self.futures:
+            future = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda _: self.futures.pop(key, None))
+            self.futures[key] = future
+
+        # Shielded so that one cancelled caller doesn't cancel the call for everyone else.
+        return await asyncio.shield(self.futures[key])
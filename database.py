@@ -1,7 +1,129 @@
 import dataclasses
+import collections
 import datetime
 import asyncpg
+import asyncio
+import caches
 import typing
+import math
+import json
+
+# Schema migrations, applied in order at startup. Never edit a migration
+# that has been deployed: append a new one instead. The first migration
+# is idempotent so that it can adopt databases created before versioning.
+MIGRATIONS = (
+    (
+        "CREATE TABLE IF NOT EXISTS guild_settings (guild_id bigint PRIMARY KEY, starboard_reaction_threshold integer, starboard_channel_id bigint, starboard_reaction_string text);",
+        "CREATE TABLE IF NOT EXISTS starboard_messages (message_id bigint PRIMARY KEY, author_id bigint NOT NULL, channel_id bigint NOT NULL, guild_id bigint NOT NULL, reply_id bigint, timestamp timestamptz NOT NULL, content text NOT NULL, attachments text NOT NULL, stickers text NOT NULL, reactions integer NOT NULL);",
+        "ALTER TABLE starboard_messages ADD COLUMN IF NOT EXISTS post_id bigint;",
+        "CREATE INDEX IF NOT EXISTS starboard_messages_guild_reactions ON starboard_messages (guild_id, reactions, message_id);",
+        "CREATE INDEX IF NOT EXISTS starboard_messages_guild_author ON starboard_messages (guild_id, author_id) INCLUDE (reactions);",
+        "ALTER TABLE starboard_messages ADD COLUMN IF NOT EXISTS search tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;",
+        "CREATE INDEX IF NOT EXISTS starboard_messages_search ON starboard_messages USING GIN (search);",
+        "CREATE TABLE IF NOT EXISTS starboard_checkpoints (guild_id bigint, channel_id bigint, before_id bigint, completed boolean NOT NULL, PRIMARY KEY (guild_id, channel_id));"
+    ),
+    (
+        "ALTER TABLE starboard_messages ALTER COLUMN attachments TYPE text[] USING COALESCE(string_to_array(NULLIF(attachments, ''), E'\\n'), '{}');",
+        "ALTER TABLE starboard_messages ALTER COLUMN stickers TYPE text[] USING COALESCE(string_to_array(NULLIF(stickers, ''), E'\\n'), '{}');",
+        "CREATE INDEX starboard_messages_guild_message ON starboard_messages (guild_id, message_id);"
+    ),
+    (
+        "CREATE TABLE manga_chapters (chapter_id text PRIMARY KEY, manga_id text NOT NULL, volume text, chapter text, number double precision, published_at timestamptz NOT NULL);",
+        "CREATE INDEX manga_chapters_manga ON manga_chapters (manga_id);",
+        "CREATE TABLE manga_syncs (manga_id text PRIMARY KEY, synced_at timestamptz NOT NULL);"
+    ),
+    (
+        "CREATE TABLE manga_follows (user_id bigint, manga_id text, channel_id bigint NOT NULL, title text NOT NULL, PRIMARY KEY (user_id, manga_id));",
+        "CREATE INDEX manga_follows_manga ON manga_follows (manga_id);",
+        "CREATE TABLE manga_polls (polled_at timestamptz NOT NULL);"
+    ),
+    (
+        "CREATE TABLE user_settings (user_id bigint PRIMARY KEY, manga_data_saver boolean NOT NULL);",
+    ),
+    (
+        "CREATE TABLE wolfram_answers (digest text PRIMARY KEY, pods jsonb NOT NULL, expires_at timestamptz NOT NULL);",
+        "CREATE INDEX wolfram_answers_expiry ON wolfram_answers (expires_at);"
+    ),
+    (
+        "CREATE TABLE starboard_authors (guild_id bigint, author_id bigint, stars bigint NOT NULL, messages bigint NOT NULL, PRIMARY KEY (guild_id, author_id));",
+        "CREATE INDEX starboard_authors_ranking ON starboard_authors (guild_id, stars DESC, author_id DESC);",
+        "INSERT INTO starboard_authors SELECT guild_id, author_id, SUM(reactions), COUNT(*) FROM starboard_messages GROUP BY guild_id, author_id;"
+    ),
+    (
+        "CREATE TABLE wolfram_queries (digest text PRIMARY KEY, parameters jsonb NOT NULL, expires_at timestamptz NOT NULL);",
+        "CREATE INDEX wolfram_queries_expiry ON wolfram_queries (expires_at);"
+    )
+)
+
+# Serialises migrations between processes sharing the database.
+MIGRATION_LOCK = 0x5354_4152
+
+# The number of queued starboard messages that triggers an early flush.
+STARBOARD_FLUSH_SIZE = 256
+
+# The number of rows fetched per round-trip when exporting.
+EXPORT_PREFETCH = 1000
+
+# The search column is maintained by Postgres and never read back.
+STARBOARD_COLUMNS = (
+    "message_id, author_id, channel_id, guild_id, reply_id, timestamp, "
+    "content, attachments, stickers, reactions, post_id"
+)
+
+# Hot-path queries are kept as constant strings so that asyncpg's statement
+# cache prepares each of them once per pooled connection rather than per call.
+STARBOARD_UPSERT = (
+    "INSERT INTO starboard_messages "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) "
+    "ON CONFLICT (message_id) "
+    "DO UPDATE SET "
+    "author_id = $2, "
+    "channel_id = $3, "
+    "guild_id = $4, "
+    "reply_id = $5, "
+    "timestamp = $6, "
+    "content = $7, "
+    "attachments = $8, "
+    "stickers = $9, "
+    "reactions = $10, "
+    "post_id = COALESCE($11, starboard_messages.post_id);"
+)
+
+# Recomputes the totals of the given (guild, author) pairs from an index-only scan of
+# (guild_id, author_id) INCLUDE (reactions), so the leaderboard never aggregates on read.
+STARBOARD_TOTALS = (
+    "INSERT INTO starboard_authors "
+    "SELECT guild_id, author_id, SUM(reactions), COUNT(*) "
+    "FROM starboard_messages "
+    "WHERE (guild_id, author_id) IN (SELECT * FROM unnest($1::bigint[], $2::bigint[])) "
+    "GROUP BY guild_id, author_id "
+    "ON CONFLICT (guild_id, author_id) "
+    "DO UPDATE SET "
+    "stars = EXCLUDED.stars, "
+    "messages = EXCLUDED.messages;"
+)
+
+# Another process may be writing messages by the same authors, so the totals of the given
+# (guild, author) pairs are locked (in a consistent order) before their messages are written.
+# Whoever waits then recomputes from a snapshot that includes the other's committed rows.
+STARBOARD_LOCK = (
+    "SELECT pg_advisory_xact_lock(hashtextextended(guild_id || ':' || author_id, 0)) "
+    "FROM unnest($1::bigint[], $2::bigint[]) AS pairs (guild_id, author_id) "
+    "ORDER BY guild_id, author_id;"
+)
+
+async def migrate(pool: asyncpg.Pool):
+    """Bring the database schema up to date."""
+    async with pool.acquire() as connection, connection.transaction():
+        await connection.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK)
+        await connection.execute("CREATE TABLE IF NOT EXISTS schema_version (version integer NOT NULL);")
+        version = await connection.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                await connection.execute(statement)
+
+            await connection.execute("INSERT INTO schema_version VALUES ($1)", number)
 
 @dataclasses.dataclass
 class GuildConfiguration:
@@ -11,33 +133,133 @@ class GuildConfiguration:
     starboard_channel_id: int | None
     starboard_reaction_string: str | None
 
+    # Guilds without a configuration are cached as None so
+    # that they don't cost a round-trip on every lookup either.
+    cache: typing.ClassVar[dict[int, "GuildConfiguration | None"]] = {}
+    statistics: typing.ClassVar[caches.Statistics] = caches.statistics("guild_settings")
+
+    # Bumped on every invalidation, so that a read that raced one doesn't cache what it saw.
+    generation: typing.ClassVar[int] = 0
+
+    # Notifications this process has sent (by backend PID and guild) and will receive itself.
+    sent: typing.ClassVar[collections.Counter[tuple[int, int]]] = collections.Counter()
+
+    @classmethod
+    async def load(cls, pool: asyncpg.Pool):
+        """Populate the cache with every guild configuration in the database."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            records = await connection.fetch("SELECT * FROM guild_settings")
+            cls.cache.update({record["guild_id"]: cls(**record) for record in records})
+
+    @classmethod
+    async def listen(cls, connection: asyncpg.Connection):
+        """Invalidate cached configurations when they are modified by another process."""
+        def invalidate(connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+            guild = int(payload)
+
+            # Our own writes have already updated the cache.
+            if (pid, guild) in cls.sent:
+                cls.unexpect((pid, guild))
+                return
+
+            cls.generation += 1
+            cls.cache.pop(guild, None)
+
+        await connection.add_listener("guild_settings", invalidate)
+
+    @classmethod
+    def unexpect(cls, key: tuple[int, int]):
+        """Stop waiting for one of our own notifications."""
+        cls.sent[key] -= 1
+
+        if cls.sent[key] <= 0:
+            del cls.sent[key]
+
+    @classmethod
+    def forget(cls):
+        """Drop every cached configuration (for when notifications may have been missed)."""
+        cls.generation += 1
+        cls.cache.clear()
+
     @classmethod
     async def read(cls, pool: asyncpg.Pool, id: int) -> "GuildConfiguration | None":
-        """Read an instance of a guild configuration from the database."""
+        """Read an instance of a guild configuration from the cache or the database."""
+        if id in cls.cache:
+            cls.statistics.hits += 1
+            return cls.cache[id]
+
+        cls.statistics.misses += 1
+        generation = cls.generation
+
         async with pool.acquire() as connection, connection.transaction(readonly=True):
             query = "SELECT * FROM guild_settings WHERE guild_id = $1"
             response = typing.cast(asyncpg.Record | None, await connection.fetchrow(query, id))
+            config = cls(**response) if response is not None else None
 
-            if response is None:
-                return None
+        if cls.generation == generation:
+            cls.cache[id] = config
+
+        return config
+
+    async def write(self, pool: asyncpg.Pool):
+        """Write this instance to the database."""
+        key = None
+
+        try:
+            async with pool.acquire() as connection, connection.transaction():
+                await connection.execute(
+                    "INSERT INTO guild_settings "
+                    "VALUES ($1, $2, $3, $4) "
+                    "ON CONFLICT (guild_id) "
+                    "DO UPDATE SET "
+                    "starboard_reaction_threshold = $2, "
+                    "starboard_channel_id = $3, "
+                    "starboard_reaction_string = $4;",
+                    self.guild_id,
+                    self.starboard_reaction_threshold,
+                    self.starboard_channel_id,
+                    self.starboard_reaction_string
+                )
+
+                # Other processes sharing this database drop their copy on commit. The notification
+                # can arrive before the commit returns, so it's expected before it's sent.
+                key = (connection.get_server_pid(), self.guild_id)
+                type(self).sent[key] += 1
+                await connection.execute("SELECT pg_notify('guild_settings', $1)", str(self.guild_id))
+        except BaseException:
+            if key is not None:
+                type(self).unexpect(key)
 
-            return cls(**response)
+            raise
+
+        type(self).generation += 1
+        type(self).cache[self.guild_id] = self
+
+@dataclasses.dataclass
+class UserConfiguration:
+    """A persistent user-specific configuration."""
+    user_id: int
+    manga_data_saver: bool
+
+    @classmethod
+    async def read(cls, pool: asyncpg.Pool, id: int) -> "UserConfiguration":
+        """Read an instance of a user configuration from the database (or the defaults)."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT * FROM user_settings WHERE user_id = $1"
+            response = typing.cast(asyncpg.Record | None, await connection.fetchrow(query, id))
+            return cls(**response) if response is not None else cls(id, False)
 
     async def write(self, pool: asyncpg.Pool):
         """Write this instance to the database."""
         async with pool.acquire() as connection, connection.transaction():
             await connection.execute(
-                "INSERT INTO guild_settings "
-                "VALUES ($1, $2, $3, $4) "
-                "ON CONFLICT (guild_id) "
+                "INSERT INTO user_settings "
+                "VALUES ($1, $2) "
+                "ON CONFLICT (user_id) "
                 "DO UPDATE SET "
-                "starboard_reaction_threshold = $2, "
-                "starboard_channel_id = $3, "
-                "starboard_reaction_string = $4;",
-                self.guild_id,
-                self.starboard_reaction_threshold,
-                self.starboard_channel_id,
-                self.starboard_reaction_string
+                "manga_data_saver = $2;",
+                self.user_id,
+                self.manga_data_saver
             )
 
 @dataclasses.dataclass
@@ -53,51 +275,459 @@ class StarboardMessage:
     attachments: list[str]
     stickers: list[str]
     reactions: int
+    post_id: int | None
+
+    # Write-behind buffer: rows are queued by `stage` and written in batches by `flush`.
+    pending: typing.ClassVar[dict[int, "StarboardMessage"]] = {}
+    flushing: typing.ClassVar[dict[int, "StarboardMessage"]] = {}
+    lock: typing.ClassVar[asyncio.Lock] = asyncio.Lock()
 
     @classmethod
     async def read(cls, pool: asyncpg.Pool, id: int) -> "StarboardMessage | None":
-        """Read an instance of a starboard message from the database."""
+        """Read an instance of a starboard message from the write-behind buffer or the database."""
+        if (message := cls.pending.get(id) or cls.flushing.get(id)) is not None:
+            return message
+
         async with pool.acquire() as connection, connection.transaction(readonly=True):
-            query = "SELECT * FROM starboard_messages WHERE message_id = $1"
+            query = f"SELECT {STARBOARD_COLUMNS} FROM starboard_messages WHERE message_id = $1"
             response = typing.cast(asyncpg.Record | None, await connection.fetchrow(query, id))
 
-            if response is None:
-                return None
+            return cls.convert(response) if response is not None else None
+
+    @classmethod
+    async def known(cls, pool: asyncpg.Pool, ids: list[int]) -> dict[int, "StarboardMessage"]:
+        """Read every starboard message in `ids` that exists, in a single query."""
+        found = {id: message for id in ids if (message := cls.pending.get(id) or cls.flushing.get(id)) is not None}
+        remaining = [id for id in ids if id not in found]
+
+        if remaining:
+            async with pool.acquire() as connection, connection.transaction(readonly=True):
+                query = f"SELECT {STARBOARD_COLUMNS} FROM starboard_messages WHERE message_id = ANY($1::bigint[])"
+                records = await connection.fetch(query, remaining)
+                found.update({record["message_id"]: cls.convert(record) for record in records})
+
+        return found
+
+    @classmethod
+    async def top(cls, pool: asyncpg.Pool, guild: int, after: "StarboardMessage | None", limit: int) -> list["StarboardMessage"]:
+        """Read a page of a guild's most reacted messages, continuing on from `after`."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            # Keyset pagination, backed by the (guild_id, reactions, message_id) index.
+            if after is None:
+                query = (
+                    f"SELECT {STARBOARD_COLUMNS} FROM starboard_messages "
+                    "WHERE guild_id = $1 "
+                    "ORDER BY reactions DESC, message_id DESC "
+                    "LIMIT $2;"
+                )
+
+                records = await connection.fetch(query, guild, limit)
+            else:
+                query = (
+                    f"SELECT {STARBOARD_COLUMNS} FROM starboard_messages "
+                    "WHERE guild_id = $1 AND (reactions, message_id) < ($2, $3) "
+                    "ORDER BY reactions DESC, message_id DESC "
+                    "LIMIT $4;"
+                )
+
+                records = await connection.fetch(query, guild, after.reactions, after.message_id, limit)
+
+            return [cls.convert(record) for record in records]
+
+    @classmethod
+    async def export(cls, pool: asyncpg.Pool, guild: int, format: typing.Literal["csv", "jsonl"], output: typing.BinaryIO):
+        """Stream every starboard message in a guild into a binary file, a chunk at a time."""
+        query = f"SELECT {STARBOARD_COLUMNS} FROM starboard_messages WHERE guild_id = $1 ORDER BY message_id"
+
+        async def write(chunk: bytes):
+            output.write(chunk)
+
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            if format == "csv":
+                await connection.copy_from_query(query, guild, output=write, format="csv", header=True)
+                return
+
+            # A server-side cursor keeps at most `EXPORT_PREFETCH` rows in memory.
+            async for record in connection.cursor(query, guild, prefetch=EXPORT_PREFETCH):
+                row = dataclasses.asdict(cls.convert(record))
+                output.write(json.dumps(row, default=str).encode() + b"\n")
 
-            # We need to convert the record into a dictionary
-            # in order to modify the attachment and sticker fields
-            # to be lists instead of newline-separated strings.
-            fields = dict(response)
-            fields["attachments"] = fields["attachments"].split("\n")
-            fields["stickers"] = fields["stickers"].split("\n")
+    @classmethod
+    def convert(cls, record: asyncpg.Record) -> "StarboardMessage":
+        """Convert a database record into an instance of a starboard message."""
+        # Records from searches carry extra columns alongside the message itself.
+        return cls(**{field.name: record[field.name] for field in dataclasses.fields(cls)})
 
-            return cls(**fields)
+    def record(self) -> tuple:
+        """Convert this instance into query arguments for `STARBOARD_UPSERT`."""
+        return (
+            self.message_id,
+            self.author_id,
+            self.channel_id,
+            self.guild_id,
+            self.reply_id,
+            self.timestamp,
+            self.content,
+            self.attachments,
+            self.stickers,
+            self.reactions,
+            self.post_id
+        )
+
+    async def write(self, pool: asyncpg.Pool):
+        """Write this instance to the database straight away, superseding any queued copy."""
+        cls = type(self)
+
+        # Holding the lock means no older copy of the row can be mid-flush either.
+        async with cls.lock:
+            cls.pending.pop(self.message_id, None)
+
+            async with pool.acquire() as connection, connection.transaction():
+                await connection.execute(STARBOARD_LOCK, [self.guild_id], [self.author_id])
+                await connection.execute(STARBOARD_UPSERT, *self.record())
+                await connection.execute(STARBOARD_TOTALS, [self.guild_id], [self.author_id])
+
+    async def stage(self, pool: asyncpg.Pool):
+        """Queue this instance to be written to the database by the next flush."""
+        cls = type(self)
+        cls.pending[self.message_id] = self
+
+        if len(cls.pending) >= STARBOARD_FLUSH_SIZE:
+            await cls.flush(pool)
+
+    @classmethod
+    async def flush(cls, pool: asyncpg.Pool):
+        """Write every queued instance to the database in a single batch."""
+        async with cls.lock:
+            if not cls.pending:
+                return
+
+            # Rows being flushed stay visible to `read` until they've been committed.
+            cls.flushing, cls.pending = cls.pending, {}
+
+            try:
+                guilds, authors = zip(*{(row.guild_id, row.author_id) for row in cls.flushing.values()})
+
+                async with pool.acquire() as connection, connection.transaction():
+                    await connection.execute(STARBOARD_LOCK, list(guilds), list(authors))
+                    await connection.executemany(STARBOARD_UPSERT, [row.record() for row in cls.flushing.values()])
+                    await connection.execute(STARBOARD_TOTALS, list(guilds), list(authors))
+            except BaseException:
+                # Put the batch back (even when cancelled) without clobbering anything queued since.
+                cls.pending = cls.flushing | cls.pending
+                raise
+            finally:
+                cls.flushing = {}
+
+@dataclasses.dataclass
+class StarboardMatch:
+    """A starboard message that matched a full-text search."""
+    message: StarboardMessage
+    rank: float
+    headline: str
+
+    @classmethod
+    async def search(cls, pool: asyncpg.Pool, guild: int, text: str, after: "StarboardMatch | None", limit: int) -> list["StarboardMatch"]:
+        """Read a page of a guild's starboard messages that match `text`, best matches first."""
+        # Only the rows on this page get the (relatively expensive) headline treatment.
+        query = (
+            "SELECT *, ts_headline('english', content, query, 'StartSel=**, StopSel=**, MaxFragments=2') AS headline "
+            "FROM ("
+            f"SELECT {STARBOARD_COLUMNS}, ts_rank_cd(search, query) AS rank, query "
+            "FROM starboard_messages, websearch_to_tsquery('english', $2) AS query "
+            "WHERE guild_id = $1 AND search @@ query AND (ts_rank_cd(search, query), message_id) < ($3, $4) "
+            "ORDER BY rank DESC, message_id DESC "
+            "LIMIT $5"
+            ") AS matches "
+            "ORDER BY rank DESC, message_id DESC;"
+        )
+
+        rank, id = (after.rank, after.message.message_id) if after is not None else (math.inf, 2 ** 63 - 1)
+
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            records = await connection.fetch(query, guild, text, rank, id, limit)
+
+            return [
+                cls(StarboardMessage.convert(record), record["rank"], record["headline"])
+                for record in records
+            ]
+
+@dataclasses.dataclass
+class StarboardAuthor:
+    """A guild member's starboard totals."""
+    author_id: int
+    stars: int
+    messages: int
+
+    @classmethod
+    async def ranking(cls, pool: asyncpg.Pool, guild: int, after: "StarboardAuthor | None", limit: int) -> list["StarboardAuthor"]:
+        """Read a page of a guild's authors ranked by total reactions, continuing on from `after`."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            # Keyset pagination over the maintained totals, backed by the ranking index.
+            if after is None:
+                query = (
+                    "SELECT author_id, stars, messages "
+                    "FROM starboard_authors "
+                    "WHERE guild_id = $1 "
+                    "ORDER BY stars DESC, author_id DESC "
+                    "LIMIT $2;"
+                )
+
+                records = await connection.fetch(query, guild, limit)
+            else:
+                query = (
+                    "SELECT author_id, stars, messages "
+                    "FROM starboard_authors "
+                    "WHERE guild_id = $1 AND (stars, author_id) < ($2, $3) "
+                    "ORDER BY stars DESC, author_id DESC "
+                    "LIMIT $4;"
+                )
+
+                records = await connection.fetch(query, guild, after.stars, after.author_id, limit)
+
+            return [cls(**record) for record in records]
+
+@dataclasses.dataclass
+class StarboardCheckpoint:
+    """How far a starboard backfill has progressed through a channel's history."""
+    guild_id: int
+    channel_id: int
+    before_id: int | None
+    completed: bool
+
+    @classmethod
+    async def read(cls, pool: asyncpg.Pool, guild: int) -> dict[int, "StarboardCheckpoint"]:
+        """Read every checkpoint for a guild, keyed by channel ID."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT * FROM starboard_checkpoints WHERE guild_id = $1"
+            records = await connection.fetch(query, guild)
+            return {record["channel_id"]: cls(**record) for record in records}
+
+    @classmethod
+    async def clear(cls, pool: asyncpg.Pool, guild: int):
+        """Delete every checkpoint for a guild."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute("DELETE FROM starboard_checkpoints WHERE guild_id = $1", guild)
+
+    async def write(self, pool: asyncpg.Pool):
+        """Write this instance to the database."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute(
+                "INSERT INTO starboard_checkpoints "
+                "VALUES ($1, $2, $3, $4) "
+                "ON CONFLICT (guild_id, channel_id) "
+                "DO UPDATE SET "
+                "before_id = $3, "
+                "completed = $4;",
+                self.guild_id,
+                self.channel_id,
+                self.before_id,
+                self.completed
+            )
+
+@dataclasses.dataclass
+class MangaChapter:
+    """An indexed chapter of a manga."""
+    chapter_id: str
+    manga_id: str
+    volume: str | None
+    chapter: str | None
+    number: float | None
+    published_at: datetime.datetime
+
+    @classmethod
+    async def read(cls, pool: asyncpg.Pool, manga: str) -> list["MangaChapter"]:
+        """Read the index of a manga, one chapter per chapter number, newest first."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            # Each scanlation of a chapter is its own row, so keep the first one published. Chapter
+            # numbers restart in some volumes, and unnumbered chapters are told apart by their ID.
+            query = (
+                "SELECT * FROM ("
+                "SELECT DISTINCT ON (volume, COALESCE(chapter, chapter_id)) * "
+                "FROM manga_chapters "
+                "WHERE manga_id = $1 "
+                "ORDER BY volume, COALESCE(chapter, chapter_id), published_at"
+                ") AS chapters "
+                "ORDER BY number DESC NULLS LAST, chapter_id;"
+            )
+
+            records = await connection.fetch(query, manga)
+            return [cls(**record) for record in records]
+
+    @classmethod
+    async def synced(cls, pool: asyncpg.Pool, manga: str) -> datetime.datetime | None:
+        """Read when the index of a manga was last brought up to date."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT synced_at FROM manga_syncs WHERE manga_id = $1"
+            return await connection.fetchval(query, manga)
+
+    @classmethod
+    async def index(cls, pool: asyncpg.Pool, manga: str, chapters: list["MangaChapter"], synced: datetime.datetime):
+        """Add chapters to the index of a manga and record when it was synced."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.executemany(
+                "INSERT INTO manga_chapters "
+                "VALUES ($1, $2, $3, $4, $5, $6) "
+                "ON CONFLICT (chapter_id) "
+                "DO UPDATE SET "
+                "volume = $3, "
+                "chapter = $4, "
+                "number = $5, "
+                "published_at = $6;",
+                [dataclasses.astuple(chapter) for chapter in chapters]
+            )
+
+            await connection.execute(
+                "INSERT INTO manga_syncs "
+                "VALUES ($1, $2) "
+                "ON CONFLICT (manga_id) "
+                "DO UPDATE SET synced_at = $2;",
+                manga,
+                synced
+            )
+
+@dataclasses.dataclass
+class MangaFollow:
+    """A user's subscription to new chapters of a manga."""
+    user_id: int
+    manga_id: str
+    channel_id: int
+    title: str
+
+    @classmethod
+    async def read(cls, pool: asyncpg.Pool, user: int) -> list["MangaFollow"]:
+        """Read every manga that a user follows."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT * FROM manga_follows WHERE user_id = $1 ORDER BY title"
+            records = await connection.fetch(query, user)
+            return [cls(**record) for record in records]
+
+    @classmethod
+    async def followed(cls, pool: asyncpg.Pool) -> list[str]:
+        """Read the ID of every manga that somebody follows."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            records = await connection.fetch("SELECT DISTINCT manga_id FROM manga_follows")
+            return [record["manga_id"] for record in records]
+
+    @classmethod
+    async def subscribers(cls, pool: asyncpg.Pool, mangas: list[str]) -> list["MangaFollow"]:
+        """Read every follow of any manga in `mangas`."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT * FROM manga_follows WHERE manga_id = ANY($1::text[])"
+            records = await connection.fetch(query, mangas)
+            return [cls(**record) for record in records]
+
+    @classmethod
+    async def polled(cls, pool: asyncpg.Pool) -> datetime.datetime | None:
+        """Read when followed manga were last polled for new chapters."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            return await connection.fetchval("SELECT MAX(polled_at) FROM manga_polls")
+
+    @classmethod
+    async def poll(cls, pool: asyncpg.Pool, polled: datetime.datetime):
+        """Record when followed manga were last polled for new chapters."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute("DELETE FROM manga_polls")
+            await connection.execute("INSERT INTO manga_polls VALUES ($1)", polled)
 
     async def write(self, pool: asyncpg.Pool):
         """Write this instance to the database."""
         async with pool.acquire() as connection, connection.transaction():
             await connection.execute(
-                "INSERT INTO starboard_messages "
-                "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10) "
-                "ON CONFLICT (message_id) "
+                "INSERT INTO manga_follows "
+                "VALUES ($1, $2, $3, $4) "
+                "ON CONFLICT (user_id, manga_id) "
                 "DO UPDATE SET "
-                "author_id = $2, "
                 "channel_id = $3, "
-                "guild_id = $4, "
-                "reply_id = $5, "
-                "timestamp = $6, "
-                "content = $7, "
-                "attachments = $8, "
-                "stickers = $9, "
-                "reactions = $10;",
-                self.message_id,
-                self.author_id,
+                "title = $4;",
+                self.user_id,
+                self.manga_id,
                 self.channel_id,
-                self.guild_id,
-                self.reply_id,
-                self.timestamp,
-                self.content,
-                "\n".join(self.attachments),
-                "\n".join(self.stickers),
-                self.reactions
+                self.title
+            )
+
+    async def delete(self, pool: asyncpg.Pool):
+        """Delete this instance from the database."""
+        async with pool.acquire() as connection, connection.transaction():
+            query = "DELETE FROM manga_follows WHERE user_id = $1 AND manga_id = $2"
+            await connection.execute(query, self.user_id, self.manga_id)
+
+@dataclasses.dataclass
+class WolframAnswer:
+    """A cached set of pods returned by Wolfram|Alpha."""
+    digest: str
+    pods: list[dict[str, typing.Any]]
+    expires_at: datetime.datetime
+
+    @classmethod
+    async def read(cls, pool: asyncpg.Pool, digest: str) -> "WolframAnswer | None":
+        """Read an answer from the database, unless it has expired."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT * FROM wolfram_answers WHERE digest = $1 AND expires_at > now()"
+            response = typing.cast(asyncpg.Record | None, await connection.fetchrow(query, digest))
+
+            if response is None:
+                return None
+
+            return cls(response["digest"], json.loads(response["pods"]), response["expires_at"])
+
+    @classmethod
+    async def prune(cls, pool: asyncpg.Pool):
+        """Delete every answer that has expired."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute("DELETE FROM wolfram_answers WHERE expires_at <= now()")
+
+    async def write(self, pool: asyncpg.Pool):
+        """Write this instance to the database."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute(
+                "INSERT INTO wolfram_answers "
+                "VALUES ($1, $2::jsonb, $3) "
+                "ON CONFLICT (digest) "
+                "DO UPDATE SET "
+                "pods = $2::jsonb, "
+                "expires_at = $3;",
+                self.digest,
+                json.dumps(self.pods),
+                self.expires_at
+            )
+
+@dataclasses.dataclass
+class WolframQuery:
+    """The parameters behind a Wolfram|Alpha digest, so that buttons only need to carry the digest."""
+    digest: str
+    parameters: list[list[str]]
+    expires_at: datetime.datetime
+
+    @classmethod
+    async def read(cls, pool: asyncpg.Pool, digest: str) -> "WolframQuery | None":
+        """Read a query from the database, unless it has expired."""
+        async with pool.acquire() as connection, connection.transaction(readonly=True):
+            query = "SELECT * FROM wolfram_queries WHERE digest = $1 AND expires_at > now()"
+            response = typing.cast(asyncpg.Record | None, await connection.fetchrow(query, digest))
+
+            if response is None:
+                return None
+
+            return cls(response["digest"], json.loads(response["parameters"]), response["expires_at"])
+
+    @classmethod
+    async def prune(cls, pool: asyncpg.Pool):
+        """Delete every query that has expired."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute("DELETE FROM wolfram_queries WHERE expires_at <= now()")
+
+    async def write(self, pool: asyncpg.Pool):
+        """Write this instance to the database."""
+        async with pool.acquire() as connection, connection.transaction():
+            await connection.execute(
+                "INSERT INTO wolfram_queries "
+                "VALUES ($1, $2::jsonb, $3) "
+                "ON CONFLICT (digest) "
+                "DO UPDATE SET "
+                "parameters = $2::jsonb, "
+                "expires_at = $3;",
+                self.digest,
+                json.dumps(self.parameters),
+                self.expires_at
             )
@@ -3,6 +3,8 @@ import discord.ext.commands as commands
 
 import discord
 import logging
+import caches
+import limits
 import bot
 
 class Debug(commands.GroupCog):
@@ -26,3 +28,28 @@ class Debug(commands.GroupCog):
             await self.bot.tree.sync(guild=snowflake)
             await interaction.response.send_message("Guild-specific commands synchronised.")
             self.logger.info("Guild-specific commands synchronised.")
+
+    @application.command(description="Show cache hit/miss statistics.")
+    async def statistics(self, interaction: discord.Interaction):
+        if not caches.REGISTRY:
+            return await interaction.response.send_message("No caches have been used yet.")
+
+        lines = (
+            f"- `{name}`: {stats.hits} hits, {stats.misses} misses ({stats.ratio:.1%})"
+            for name, stats in sorted(caches.REGISTRY.items())
+        )
+
+        await interaction.response.send_message(limits.limit("\n".join(lines), limits.MESSAGE_CHARACTERS))
+
+    @application.command(description="Show outbound HTTP statistics for each host.")
+    async def network(self, interaction: discord.Interaction):
+        if not self.bot.network.hosts:
+            return await interaction.response.send_message("No requests have been sent yet.")
+
+        lines = (
+            f"- `{name}`: {host.requests} requests, {host.retries} retries, "
+            f"{host.throttled} throttled, {host.waiting} queued ({host.budget:.1f} retries banked)"
+            for name, host in sorted(self.bot.network.hosts.items())
+        )
+
+        await interaction.response.send_message(limits.limit("\n".join(lines), limits.MESSAGE_CHARACTERS))
@@ -1,7 +1,7 @@
 import dozza.types as types
 
 import dataclasses
-import aiohttp
+import network
 import typing
 
 class Error(Exception):
@@ -18,9 +18,9 @@ class Joke:
     quip: str
     followup: str | None
 
-async def request(session: aiohttp.ClientSession) -> types.Reply:
+async def request(client: network.Client) -> types.Reply:
     """Request a joke from the sv443 JokeAPI."""
-    async with session.get("https://v2.jokeapi.dev/joke/Any") as response:
+    async with client.get("https://v2.jokeapi.dev/joke/Any") as response:
         payload = typing.cast(types.Payload, await response.json())
 
         if payload["error"]:
@@ -30,9 +30,9 @@ async def request(session: aiohttp.ClientSession) -> types.Reply:
 
         return typing.cast(types.Reply, payload)
 
-async def funny(session: aiohttp.ClientSession) -> Joke:
+async def funny(client: network.Client) -> Joke:
     """Get a fucking joke."""
-    response = await request(session)
+    response = await request(client)
 
     # This is valid since the response must either be a single or compound joke.
     quip = typing.cast(str, response.get("joke") or response.get("setup"))
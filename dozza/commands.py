@@ -16,7 +16,7 @@ class Dozza(commands.Cog):
         await interaction.response.defer(thinking=True)
 
         try:
-            joke = await backend.funny(self.bot.session)
+            joke = await backend.funny(self.bot.network)
         except backend.Error as error:
             message = f"An unexpected error occurred during joke fetching: {error.reason}"
             return await interaction.followup.send(message)
@@ -14,6 +14,8 @@ SELECT_LABEL = 80
 SELECT_VALUE = 100
 SELECT_DESCRIPTION = 100
 SELECT_OPTIONS = 25
+BUTTON_LABEL = 80
+CUSTOM_ID = 100
 
 def limit(string: str, n: int) -> str:
     """Limit a string to `n` characters."""
@@ -1,10 +1,42 @@
 import manga.types as types
 
 import dataclasses
-import aiohttp
+import database
+import datetime
+import network
+import asyncpg
 import asyncio
+import caches
 import typing
 
+# People search for the same handful of titles all day.
+SEARCHES = caches.LRU[str, list["Manga"]](512, caches.statistics("mangadex_search"), lifetime=60 * 60)
+SEARCH_FLIGHTS = caches.Flights[str, list["Manga"]]()
+
+# At-home base URLs are valid for 15 minutes, give or take.
+AT_HOME_LIFETIME = 10 * 60
+
+# How often a manga's chapter index is synced, and by how much syncs overlap.
+SYNC_INTERVAL = datetime.timedelta(minutes=10)
+SYNC_OVERLAP = datetime.timedelta(minutes=5)
+SYNC_FLIGHTS = caches.Flights[str, None]()
+
+# Chapter lists read from the index, shared by every reader of the same manga.
+CHAPTERS = caches.LRU[str, list["Chapter"]](256, caches.statistics("manga_chapters"), lifetime=SYNC_INTERVAL.total_seconds())
+
+# The maximum page size and pagination window of the feed endpoints.
+FEED_LIMIT = 500
+FEED_WINDOW = 10000
+
+# The maximum number of manga and chapters per request to the chapter list endpoint,
+# along with the delay between requests when polling for updates.
+UPDATES_MANGA = 100
+UPDATES_LIMIT = 100
+UPDATES_SPACING = 0.5
+
+# Author names practically never change, so remember them for a long time.
+AUTHORS = caches.LRU[str, str](8192, caches.statistics("mangadex_authors"), lifetime=24 * 60 * 60)
+
 class Error(Exception):
     """Mangadex returned an error."""
     def __init__(self, reason: str):
@@ -18,6 +50,7 @@ class Relationship:
     """Defines the relationship of a person to a manga."""
     id: str
     type: str
+    name: str | None
 
 @dataclasses.dataclass
 class Chapter:
@@ -26,16 +59,18 @@ class Chapter:
     volume: str | None
     chapter: str
 
-    async def pages(self, session: aiohttp.ClientSession) -> list[str]:
-        """Request the pages for this chapter."""
+    async def pages(self, client: network.Client, saver: bool = False) -> list[str]:
+        """Request the pages for this chapter, optionally as compressed data-saver images."""
         metadata = typing.cast(
             types.CDNResponse,
-            await request(session, f"https://api.mangadex.org/at-home/server/{self.id}")
+            await request(client, f"https://api.mangadex.org/at-home/server/{self.id}")
         )
 
+        quality, images = ("data-saver", metadata["chapter"]["dataSaver"]) if saver else ("data", metadata["chapter"]["data"])
+
         return [
-            f"{metadata['baseUrl']}/data/{metadata['chapter']['hash']}/{image}"
-            for image in metadata["chapter"]["data"]
+            f"{metadata['baseUrl']}/{quality}/{metadata['chapter']['hash']}/{image}"
+            for image in images
         ]
 
 @dataclasses.dataclass
@@ -50,39 +85,124 @@ class Manga:
     status: str | None
     year: int | None
 
-    async def authors(self, session: aiohttp.ClientSession) -> list[str]:
-        """Request the names of the authors."""
-        callbacks = [
-            request(session, f"https://api.mangadex.org/author/{rel.id}")
-            for rel in self.relationships if rel.type == "author"
-        ]
+    async def authors(self, client: network.Client) -> list[str]:
+        """Get the names of the authors, requesting any that are unknown in a single batch."""
+        relationships = [rel for rel in self.relationships if rel.type == "author"]
+        names = {rel.id: name for rel in relationships if (name := rel.name or AUTHORS.get(rel.id)) is not None}
 
-        results = typing.cast(list[types.AuthorResponse], await asyncio.gather(*callbacks))
-        return [result["data"]["attributes"]["name"] for result in results]
-
-    async def chapters(self, session: aiohttp.ClientSession) -> list[Chapter]:
-        """Request the list of chapters."""
-        aggregate = typing.cast(
-            types.AggregateResponse,
-            await request(
-                session,
-                f"https://api.mangadex.org/manga/{self.id}/aggregate",
-                params={"translatedLanguage[]": "en"}
+        if missing := [rel.id for rel in relationships if rel.id not in names]:
+            result = typing.cast(
+                types.AuthorList,
+                await request(
+                    client,
+                    "https://api.mangadex.org/author",
+                    params=[("limit", str(len(missing)))] + [("ids[]", id) for id in missing]
+                )
             )
-        )
 
-        alpha = typing.cast(dict[str, types.Volume], dict())
-        beta = typing.cast(dict[str, types.Chapter], dict())
+            for author in result["data"]:
+                names[author["id"]] = AUTHORS[author["id"]] = author["attributes"]["name"]
 
-        return [
-            Chapter(chapter["id"], vol if (vol := volume["volume"]) != "none" else None, chapter["chapter"])
-            for volume in (alpha if isinstance(aggregate["volumes"], list) else aggregate["volumes"]).values()
-            for chapter in (beta if isinstance(volume["chapters"], list) else volume["chapters"]).values()
+        return [names[rel.id] for rel in relationships if rel.id in names]
+
+    async def chapters(self, client: network.Client, pool: asyncpg.Pool) -> list[Chapter]:
+        """Get the list of chapters from the index, syncing it first if it's out of date."""
+        await SYNC_FLIGHTS.run(self.id, lambda: self.sync(client, pool))
+        CHAPTERS.pop(self.id)
+        return await indexed(pool, self.id)
+
+    async def sync(self, client: network.Client, pool: asyncpg.Pool):
+        """Add any chapters published since the last sync to the index."""
+        synced = await database.MangaChapter.synced(pool, self.id)
+        started = datetime.datetime.now(datetime.timezone.utc)
+
+        if synced is not None and started - synced < SYNC_INTERVAL:
+            return
+
+        # Overlap with the previous sync a little, since re-indexing a chapter is harmless.
+        chapters, complete = await self.feed(client, synced - SYNC_OVERLAP if synced is not None else None)
+
+        # An incomplete sync only counts up to the newest chapter it saw, so the next one carries on from there.
+        if not complete:
+            started = max((chapter.published_at for chapter in chapters), default=synced or started)
+
+        await database.MangaChapter.index(pool, self.id, chapters, started)
+
+    async def feed(self, client: network.Client, since: datetime.datetime | None) -> tuple[list[database.MangaChapter], bool]:
+        """Request the English chapters published since `since` (or all of them), and whether that was all of them."""
+        chapters = []
+        offset = 0
+
+        while True:
+            params = [
+                ("translatedLanguage[]", "en"),
+                ("order[publishAt]", "asc"),
+                ("limit", str(FEED_LIMIT)),
+                ("offset", str(offset))
+            ]
+
+            if since is not None:
+                params.append(("publishAtSince", since.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")))
+
+            result = typing.cast(
+                types.ChapterList,
+                await request(client, f"https://api.mangadex.org/manga/{self.id}/feed", params=params)
+            )
+
+            # External chapters are hosted elsewhere and have no pages to read here.
+            chapters.extend(
+                convert(chapter, self.id)
+                for chapter in result["data"] if chapter["attributes"]["externalUrl"] is None
+            )
+
+            offset += FEED_LIMIT
+            if offset >= result["total"]:
+                return chapters, True
+
+            # Mangadex refuses to paginate past the first 10,000 results,
+            # so start a new window from the newest chapter seen so far.
+            if offset + FEED_LIMIT > FEED_WINDOW:
+                newest = max(datetime.datetime.fromisoformat(chapter["attributes"]["publishAt"]) for chapter in result["data"])
+
+                # Every chapter in the window was published at the same instant.
+                if since is not None and newest <= since:
+                    return chapters, False
+
+                since, offset = newest, 0
+
+async def indexed(pool: asyncpg.Pool, manga: str) -> list[Chapter]:
+    """Get the list of chapters of a manga from the index as it stands."""
+    if (chapters := CHAPTERS.get(manga)) is None:
+        chapters = [
+            Chapter(row.chapter_id, row.volume, row.chapter or "none")
+            for row in await database.MangaChapter.read(pool, manga)
         ]
 
-async def request(session: aiohttp.ClientSession, url: str, **kwargs) -> types.Payload:
+        CHAPTERS[manga] = chapters
+
+    return chapters
+
+def convert(chapter: types.ChapterObject, manga: str) -> database.MangaChapter:
+    """Convert a Chapter object into a chapter index entry."""
+    return database.MangaChapter(
+        chapter["id"],
+        manga,
+        chapter["attributes"]["volume"],
+        chapter["attributes"]["chapter"],
+        number(chapter["attributes"]["chapter"]),
+        datetime.datetime.fromisoformat(chapter["attributes"]["publishAt"])
+    )
+
+def number(chapter: str | None) -> float | None:
+    """Convert a chapter number into something that can be sorted."""
+    try:
+        return float(chapter) if chapter is not None else None
+    except ValueError:
+        return None
+
+async def request(client: network.Client, url: str, **kwargs) -> types.Payload:
     """Send a request to the Mangadex API."""
-    async with session.get(url, **kwargs) as response:
+    async with client.get(url, **kwargs) as response:
         payload = typing.cast(types.Payload, await response.json())
 
         if payload["result"] == "error":
@@ -91,22 +211,77 @@ async def request(session: aiohttp.ClientSession, url: str, **kwargs) -> types.P
 
         return payload
 
-async def search(session: aiohttp.ClientSession, title: str) -> list[Manga]:
-    """Search for a manga."""
+def normalise(title: str) -> str:
+    """Normalise a title so that trivially different searches share a cache entry."""
+    return " ".join(title.casefold().split())
+
+async def updates(client: network.Client, mangas: list[str], since: datetime.datetime) -> list[database.MangaChapter]:
+    """Request the English chapters of any of `mangas` published since `since`, in as few requests as possible."""
+    chapters = []
+
+    # Each request can filter on up to 100 manga at once.
+    for begin in range(0, len(mangas), UPDATES_MANGA):
+        offset = 0
+
+        while True:
+            params = [("manga[]", id) for id in mangas[begin:begin + UPDATES_MANGA]] + [
+                ("translatedLanguage[]", "en"),
+                ("publishAtSince", since.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")),
+                ("includeFuturePublishAt", "0"),
+                ("order[publishAt]", "asc"),
+                ("limit", str(UPDATES_LIMIT)),
+                ("offset", str(offset))
+            ]
+
+            result = typing.cast(types.ChapterList, await request(client, "https://api.mangadex.org/chapter", params=params))
+
+            chapters.extend(
+                convert(chapter, manga["id"])
+                for chapter in result["data"] if chapter["attributes"]["externalUrl"] is None
+                for manga in chapter["relationships"] if manga["type"] == "manga"
+            )
+
+            # Stay well under the global rate limit, however many manga are followed.
+            await asyncio.sleep(UPDATES_SPACING)
+
+            offset += UPDATES_LIMIT
+            if offset >= result["total"] or offset + UPDATES_LIMIT > FEED_WINDOW:
+                break
+
+    return chapters
+
+async def search(client: network.Client, title: str) -> list[Manga]:
+    """Search for a manga, reusing recent (or in-flight) results for the same title."""
+    key = normalise(title)
+
+    if (results := SEARCHES.get(key)) is None:
+        results = await SEARCH_FLIGHTS.run(key, lambda: query(client, key))
+        SEARCHES[key] = results
+
+    return list(results)
+
+async def query(client: network.Client, title: str) -> list[Manga]:
+    """Send a search request for a manga."""
     result = typing.cast(
         types.MangaList,
         await request(
-            session,
+            client,
             "https://api.mangadex.org/manga",
-            params={"title": title}
+            params={"title": title, "includes[]": "author"}
         )
     )
 
+    # Expanded relationships carry the author's name along with the search results.
+    for manga in result["data"]:
+        for rel in manga["relationships"]:
+            if rel["type"] == "author" and (attributes := rel.get("attributes")) is not None:
+                AUTHORS[rel["id"]] = attributes["name"]
+
     return [
         Manga(
             manga["id"],
             [tag["attributes"]["name"]["en"] for tag in manga["attributes"]["tags"] if "en" in tag["attributes"]["name"]],
-            [Relationship(rel["id"], rel["type"]) for rel in manga["relationships"]],
+            [Relationship(rel["id"], rel["type"], (rel.get("attributes") or {}).get("name")) for rel in manga["relationships"]],
             manga["attributes"]["title"].get("en"),
             manga["attributes"]["description"].get("en"),
             audience.capitalize() if (audience := manga["attributes"]["publicationDemographic"]) is not None else None,
@@ -1,24 +1,205 @@
 import discord.app_commands as application
 import discord.ext.commands as commands
+import discord.ext.tasks as tasks
 import manga.backend as backend
 
-import aiohttp
+import database
+import debug
+import network
+import asyncio
+import logging
 import discord
+import caches
 import limits
+import typing
 import views
 import bot
 import re
 
+# Pages of nearby chapters are resolved ahead of time, but the at-home
+# base URLs they're built on eventually stop working. Every reader shares these.
+PAGES = caches.LRU[tuple[str, bool], list[str]](256, caches.statistics("manga_pages"), lifetime=backend.AT_HOME_LIFETIME)
+PAGE_FLIGHTS = caches.Flights[tuple[str, bool], list[str]]()
+PREFETCHES: set[asyncio.Task] = set()
+
+# Polling for new chapters speeds up while they're being released and backs off otherwise.
+POLL_MINIMUM = 5 * 60
+POLL_MAXIMUM = 60 * 60
+POLL_BACKOFF = 1.5
+
+# The number of channels that are sent notifications at once.
+NOTIFY_CONCURRENCY = 4
+
+# The most chapters the picker lists at once (one page of select menus).
+PICKER_CHAPTERS = limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1)
+
+def describe(chapter: backend.Chapter) -> str:
+    """Describe a chapter for use in a select menu."""
+    volume = f"Volume {chapter.volume}, " if chapter.volume is not None else ""
+    return limits.limit(f"{volume}Chapter {chapter.chapter}", limits.SELECT_LABEL)
+
+def group(chapters: list[backend.Chapter]) -> list[tuple[str, list[backend.Chapter]]]:
+    """Split a list of chapters into at most one menu's worth of labelled groups."""
+    volumes: list[tuple[str | None, list[backend.Chapter]]] = []
+
+    for chapter in chapters:
+        if volumes and volumes[-1][0] == chapter.volume:
+            volumes[-1][1].append(chapter)
+        else:
+            volumes.append((chapter.volume, [chapter]))
+
+    # Remember that the chapters are ordered backwards.
+    if 1 < len(volumes) <= limits.SELECT_OPTIONS:
+        return [
+            (f"Volume {volume or 'Unknown'} (Chapters {members[-1].chapter} to {members[0].chapter})", members)
+            for volume, members in volumes
+        ]
+
+    size = max(PICKER_CHAPTERS, -(-len(chapters) // limits.SELECT_OPTIONS))
+    ranges = [chapters[index:index + size] for index in range(0, len(chapters), size)]
+    return [(f"Chapters {members[-1].chapter} to {members[0].chapter}", members) for members in ranges]
+
 class Manga(commands.GroupCog):
     def __init__(self, bot: bot.Bot):
         super().__init__()
+        self.logger = logging.getLogger(f"bakerbot.{__package__}")
         self.bot = bot
 
+    async def cog_load(self):
+        """Start polling for new chapters of followed manga and handle reader buttons."""
+        self.bot.add_dynamic_items(ReaderButton)
+        self.poll.start()
+
+    async def cog_unload(self):
+        """Stop polling for new chapters of followed manga and handling reader buttons."""
+        self.bot.remove_dynamic_items(ReaderButton)
+        self.poll.cancel()
+
+    @tasks.loop(seconds=POLL_MINIMUM)
+    async def poll(self):
+        """Poll for new chapters, backing off while nothing is being released."""
+        try:
+            found = await self.notify()
+        except Exception:
+            self.logger.exception("Failed to poll for new chapters.")
+            found = False
+
+        seconds = POLL_MINIMUM if found else min(POLL_MAXIMUM, (self.poll.seconds or POLL_MINIMUM) * POLL_BACKOFF)
+        self.poll.change_interval(seconds=seconds)
+
+    @poll.before_loop
+    async def ready(self):
+        """Wait until notifications can actually be sent."""
+        await self.bot.wait_until_ready()
+
+    async def notify(self) -> bool:
+        """Notify subscribers of any chapters released since the last poll, returning whether there were any."""
+        started = discord.utils.utcnow()
+        polled = await database.MangaFollow.polled(self.bot.pool)
+        since = polled or started
+        mangas = await database.MangaFollow.followed(self.bot.pool)
+        chapters = await backend.updates(self.bot.network, mangas, since) if mangas else []
+
+        # The cursor only moves as far as the newest chapter we've actually seen (but never into the
+        # future), and since the feed's filter is inclusive, chapters at the cursor itself were already announced.
+        chapters = [chapter for chapter in chapters if polled is None or chapter.published_at > polled]
+        newest = max((chapter.published_at for chapter in chapters), default=since)
+        await database.MangaFollow.poll(self.bot.pool, min(newest, started))
+
+        if not chapters:
+            return False
+
+        releases: dict[str, list[database.MangaChapter]] = {}
+        for chapter in chapters:
+            releases.setdefault(chapter.manga_id, []).append(chapter)
+
+        # Subscribers are grouped by channel so that each channel gets as few messages as possible.
+        follows = await database.MangaFollow.subscribers(self.bot.pool, list(releases))
+        channels: dict[int, dict[str, set[int]]] = {}
+        titles = {follow.manga_id: follow.title for follow in follows}
+
+        for follow in follows:
+            channels.setdefault(follow.channel_id, {}).setdefault(follow.manga_id, set()).add(follow.user_id)
+
+        semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+        await asyncio.gather(*(
+            self.announce(semaphore, channel, subscriptions, titles, releases)
+            for channel, subscriptions in channels.items()
+        ))
+
+        return True
+
+    async def announce(self, semaphore: asyncio.Semaphore, id: int, subscriptions: dict[str, set[int]], titles: dict[str, str], releases: dict[str, list[database.MangaChapter]]):
+        """Send a batch of new chapter notifications to a channel."""
+        lines = []
+
+        for manga, users in subscriptions.items():
+            links = ", ".join(f"[{chapter.chapter or 'Oneshot'}](https://mangadex.org/chapter/{chapter.chapter_id})" for chapter in releases[manga])
+            mentions = " ".join(f"<@{user}>" for user in users)
+            lines.append(limits.limit(f"- **{titles[manga]}**: {links} {mentions}", limits.MESSAGE_CHARACTERS))
+
+        async with semaphore:
+            try:
+                channel = self.bot.get_channel(id) or await self.bot.fetch_channel(id)
+                if not isinstance(channel, discord.abc.Messageable):
+                    return
+
+                message = "New chapters released!"
+                for line in lines:
+                    if len(message) + len(line) + 1 > limits.MESSAGE_CHARACTERS:
+                        await channel.send(message, suppress_embeds=True)
+                        message = ""
+
+                    message = f"{message}\n{line}" if message else line
+
+                await channel.send(message, suppress_embeds=True)
+            except discord.HTTPException:
+                self.logger.exception(f"Failed to send chapter notifications to channel {id}.")
+
+    @application.command(description="Get notified in this channel when new chapters of a manga are released.")
+    @application.describe(title="The title of a manga.")
+    async def follow(self, interaction: discord.Interaction, title: str):
+        await interaction.response.defer(thinking=True)
+        if not (titles := await backend.search(self.bot.network, title)):
+            return await interaction.followup.send("No manga found.")
+
+        paginator = views.Paginator(
+            lambda title: (
+                limits.limit(title.title or "Unknown Title", limits.SELECT_LABEL),
+                limits.limit(title.description or "No description given.", limits.SELECT_DESCRIPTION)
+            ),
+
+            titles
+        )
+
+        await interaction.followup.send(view=paginator, suppress_embeds=True)
+
+        if (manga := await paginator.wait()) is not None:
+            channel = typing.cast(discord.abc.Snowflake, interaction.channel)
+            name = manga.title or "Unknown Title"
+            await database.MangaFollow(interaction.user.id, manga.id, channel.id, name).write(self.bot.pool)
+
+            message = f"You'll be notified in this channel when new chapters of **{name}** are released."
+            await interaction.edit_original_response(content=message, view=None)
+
+    @application.command(description="Stop getting notified about new chapters of a manga.")
+    async def unfollow(self, interaction: discord.Interaction):
+        if not (follows := await database.MangaFollow.read(self.bot.pool, interaction.user.id)):
+            return await interaction.response.send_message("You aren't following any manga.")
+
+        paginator = views.Paginator(lambda follow: (limits.limit(follow.title, limits.SELECT_LABEL), ""), follows)
+        await interaction.response.send_message(view=paginator)
+
+        if (follow := await paginator.wait()) is not None:
+            await follow.delete(self.bot.pool)
+            message = f"You'll no longer be notified about new chapters of **{follow.title}**."
+            await interaction.edit_original_response(content=message, view=None)
+
     @application.command(description="Get information about a manga via Mangadex.")
     @application.describe(title="The title of a manga.")
     async def info(self, interaction: discord.Interaction, title: str):
         await interaction.response.defer(thinking=True)
-        if not (titles := await backend.search(self.bot.session, title)):
+        if not (titles := await backend.search(self.bot.network, title)):
             return await interaction.followup.send("No manga found.")
 
         paginator = views.Paginator(
@@ -33,7 +214,7 @@ class Manga(commands.GroupCog):
         await interaction.followup.send(view=paginator, suppress_embeds=True)
 
         if (manga := await paginator.wait()) is not None:
-            authors = await manga.authors(self.bot.session)
+            authors = await manga.authors(self.bot.network)
             authors = ", ".join(authors)
             tags = ", ".join(manga.tags)
             summary = manga.description or "No description given."
@@ -57,87 +238,220 @@ class Manga(commands.GroupCog):
     async def read(self, interaction: discord.Interaction, title: str):
         await interaction.response.defer(thinking=True)
 
-        if not (titles := await backend.search(self.bot.session, title)):
+        if not (titles := await backend.search(self.bot.network, title)):
             return await interaction.followup.send("No manga found.")
-        if not (chapters := await titles[0].chapters(self.bot.session)):
+        if not (chapters := await titles[0].chapters(self.bot.network, self.bot.pool)):
             return await interaction.followup.send("No chapters found.")
 
-        paginator = views.Paginator(
-            lambda chapter: ((
-                f"Volume {vol}, " if (vol := chapter.volume) is not None else "") +
-                f"Chapter {chapter.chapter}", ""
-            ),
+        picker = Picker(chapters)
+        await interaction.followup.send(view=picker)
 
-            chapters
-        )
+        if (chapter := await picker.wait()) is not None:
+            config = await database.UserConfiguration.read(self.bot.pool, interaction.user.id)
+            pages = await resolve(self.bot.network, chapter, config.manga_data_saver)
+            index = chapters.index(chapter)
 
-        await interaction.followup.send(view=paginator)
-
-        if (chapter := await paginator.wait()) is not None:
-            pages = await chapter.pages(self.bot.session)
-            reader = Reader(self.bot.session, chapters, chapter, pages)
+            reader = Reader(titles[0].id, chapters, index, 0, pages, config.manga_data_saver)
             await interaction.edit_original_response(content=pages[0], view=reader)
+            prefetch(self.bot.network, chapters, index, config.manga_data_saver)
 
-class Reader(views.View):
-    """An interactive manga reader built with Discord components."""
-    def __init__(self, session: aiohttp.ClientSession, chapters: list[backend.Chapter], chapter: backend.Chapter, pages: list[str]):
-        super().__init__()
-        self.session = session
+    @application.command(description="Choose whether the manga reader uses compressed images by default.")
+    @application.describe(enabled="Whether to read manga with smaller, lower quality images.")
+    async def saver(self, interaction: discord.Interaction, enabled: bool):
+        await database.UserConfiguration(interaction.user.id, enabled).write(self.bot.pool)
+        await interaction.response.send_message(f"Data saver mode {'enabled' if enabled else 'disabled'}.", ephemeral=True)
 
-        # Remember that the chapters are ordered backwards.
+class Picker(views.View):
+    """Let users narrow down a long list of chapters by volume or range."""
+    def __init__(self, chapters: list[backend.Chapter]):
+        super().__init__()
         self.chapters = chapters
-        self.pages = pages
-
-        self.chapter = chapters.index(chapter)
-        self.page = 0
-
-    @discord.ui.button(label="Last", row=0)
-    async def last(self, interaction: discord.Interaction, button: discord.ui.Button):
-        """Move the reader to the last page."""
-        self.page = len(self.pages) - 1
-        await interaction.response.edit_message(content=self.pages[self.page])
-
-    @discord.ui.button(label="Next", row=0)
-    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        """Move the reader to the next page."""
-        self.page = min(len(self.pages) - 1, self.page + 1)
-        await interaction.response.edit_message(content=self.pages[self.page])
-
-    @discord.ui.button(label="Previous", row=0)
-    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
-        """Move the reader to the previous page."""
-        self.page = max(0, self.page - 1)
-        await interaction.response.edit_message(content=self.pages[self.page])
-
-    @discord.ui.button(label="First", row=0)
-    async def first(self, interaction: discord.Interaction, button: discord.ui.Button):
-        """Move the reader to the first page."""
-        self.page = 0
-        await interaction.response.edit_message(content=self.pages[self.page])
-
-    @discord.ui.button(label="Next Chapter", row=1)
-    async def forward(self, interaction: discord.Interaction, button: discord.ui.Button):
-        """Move the reader to the next chapter."""
-        # Chapters are ordered backwards.
-        if (new := max(0, self.chapter - 1)) == 0:
-            return await interaction.response.defer()
-
-        self.chapter = new
-        self.page = 0
-
-        chapter = self.chapters[self.chapter]
-        self.pages = await chapter.pages(self.session)
-        await interaction.response.edit_message(content=self.pages[self.page])
-
-    @discord.ui.button(label="Previous Chapter", row=1)
+        self.selection: backend.Chapter | None = None
+
+        # Each narrowing step is remembered so that users can go back.
+        self.path: list[list[backend.Chapter]] = []
+        self.current: list[backend.Chapter] = []
+        self.groups: list[tuple[str, list[backend.Chapter]]] = []
+        self.narrow(chapters)
+
+    def narrow(self, chapters: list[backend.Chapter]):
+        """Show the given chapters, or groups of them if there are too many to list."""
+        for item in self.children.copy():
+            if isinstance(item, discord.ui.Select):
+                self.remove_item(item)
+
+        self.current = chapters
+        self.back.disabled = not self.path
+
+        if len(chapters) <= PICKER_CHAPTERS:
+            for begin in range(0, len(chapters), limits.SELECT_OPTIONS):
+                menu = discord.ui.Select(placeholder="Please choose a chapter.")
+                menu.callback = self.choose
+                self.add_item(menu)
+
+                for index, chapter in enumerate(chapters[begin:begin + limits.SELECT_OPTIONS], begin):
+                    menu.add_option(label=describe(chapter), value=str(index))
+        else:
+            self.groups = group(chapters)
+            menu = discord.ui.Select(placeholder="Please choose a range of chapters.")
+            menu.callback = self.descend
+            self.add_item(menu)
+
+            for index, (label, _) in enumerate(self.groups):
+                menu.add_option(label=limits.limit(label, limits.SELECT_LABEL), value=str(index))
+
+    async def wait(self) -> backend.Chapter | None:
+        """Wait for a chapter to be chosen."""
+        await super().wait()
+        return self.selection
+
+    async def finish(self, interaction: discord.Interaction, chapter: backend.Chapter):
+        """Return the chosen chapter and lock the picker."""
+        self.selection = chapter
+
+        for item in self.children.copy():
+            if isinstance(item, discord.ui.Button):
+                self.remove_item(item)
+            else:
+                menu = typing.cast(discord.ui.Select, item)
+                menu.disabled = True
+
+        self.add_item(discord.ui.Button(label="Discombobulating...", disabled=True, row=4))
+        await interaction.response.edit_message(view=self)
+        self.stop()
+
+    async def descend(self, interaction: discord.Interaction):
+        """Narrow the picker down to the chosen group of chapters."""
+        value, = map(int, interaction.data["values"]) # type: ignore
+        self.path.append(self.current)
+        self.narrow(self.groups[value][1])
+        await interaction.response.edit_message(view=self)
+
+    async def choose(self, interaction: discord.Interaction):
+        """Select a chapter to return."""
+        value, = map(int, interaction.data["values"]) # type: ignore
+        await self.finish(interaction, self.current[value])
+
+    @discord.ui.button(label="Back", row=4)
     async def back(self, interaction: discord.Interaction, button: discord.ui.Button):
-        """Move the reader to the previous chapter."""
-        if (new := min(len(self.chapters) - 1, self.chapter + 1)) == len(self.chapters) - 1:
-            return await interaction.response.defer()
+        """Return to the previous set of groups."""
+        if self.path:
+            self.narrow(self.path.pop())
+
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.button(label="Jump to Chapter", row=4)
+    async def jump(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """Ask for a chapter number to jump straight to."""
+        await interaction.response.send_modal(Jump(self))
+
+class Jump(discord.ui.Modal, title="Jump to Chapter"):
+    """Asks for the number of a chapter to pick."""
+    number = discord.ui.TextInput(label="Chapter", placeholder="For example, 42 or 10.5", max_length=16)
+
+    def __init__(self, picker: Picker):
+        super().__init__()
+        self.picker = picker
+
+    async def on_submit(self, interaction: discord.Interaction):
+        """Pick the chapter with the given number, if there is one."""
+        text = self.number.value.strip()
+        target = backend.number(text)
+
+        for chapter in self.picker.chapters:
+            if chapter.chapter == text or (target is not None and backend.number(chapter.chapter) == target):
+                return await self.picker.finish(interaction, chapter)
+
+        await interaction.response.send_message(f"Chapter {text} not found.", ephemeral=True)
+
+    async def on_error(self, interaction: discord.Interaction, error: Exception):
+        """Called when an error occurs inside the modal."""
+        self.picker.stop()
+        await debug.errors.on_view_error(interaction, error)
+
+class Reader(views.View):
+    """An interactive manga reader built with stateless Discord components."""
+    def __init__(self, manga: str, chapters: list[backend.Chapter], index: int, page: int, pages: list[str], saver: bool):
+        # Every button carries the state it leads to, so nothing needs to be kept around.
+        super().__init__(timeout=None)
+
+        # Remember that the chapters are ordered backwards.
+        chapter = chapters[index].id
+        newer = chapters[index - 1].id if index > 0 else chapter
+        older = chapters[index + 1].id if index < len(chapters) - 1 else chapter
+        final = len(pages) - 1
+
+        buttons = (
+            ("Last", 0, "l", chapter, final, saver, page == final),
+            ("Next", 0, "n", chapter, min(final, page + 1), saver, page == final),
+            ("Previous", 0, "p", chapter, max(0, page - 1), saver, page == 0),
+            ("First", 0, "f", chapter, 0, saver, page == 0),
+            ("Next Chapter", 1, "c", newer, 0, saver, index == 0),
+            ("Previous Chapter", 1, "b", older, 0, saver, index == len(chapters) - 1),
+            (f"Data Saver: {'On' if saver else 'Off'}", 1, "s", chapter, page, not saver, False)
+        )
+
+        for label, row, action, target, number, quality, disabled in buttons:
+            self.add_item(ReaderButton(label, row, disabled, action, manga, target, number, quality))
+
+class ReaderButton(views.Stateless, prefix="mr", version=1):
+    """A reader button that leads to a specific page of a manga."""
+    def __init__(self, label: str, row: int, disabled: bool, action: str, manga: str, chapter: str, page: int, saver: bool):
+        # The action only keeps custom IDs unique when two buttons lead to the same page.
+        fields = (action, views.compress(manga), views.compress(chapter), page, int(saver))
+        button = discord.ui.Button(label=label, row=row, disabled=disabled, custom_id=self.encode(*fields))
+        super().__init__(button)
+
+        self.manga = manga
+        self.chapter = chapter
+        self.page = page
+        self.saver = saver
+
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, button: discord.ui.Button, version: int, fields: list[str]) -> "ReaderButton":
+        """Rebuild the button from the fields of its custom ID."""
+        if version != cls.version:
+            raise ValueError(f"unsupported reader button version {version}")
+
+        action, manga, chapter, page, saver = fields
+        return cls(button.label or "", button.row or 0, button.disabled, action, views.decompress(manga), views.decompress(chapter), int(page), saver == "1")
+
+    async def callback(self, interaction: discord.Interaction):
+        """Show the page that this button leads to."""
+        client = typing.cast(bot.Bot, interaction.client)
+        chapters = await backend.indexed(client.pool, self.manga)
+
+        if (index := next((i for i, chapter in enumerate(chapters) if chapter.id == self.chapter), None)) is None:
+            return await interaction.response.send_message("This chapter is no longer available.", ephemeral=True)
+
+        pages = await resolve(client.network, chapters[index], self.saver)
+        page = min(self.page, len(pages) - 1)
+
+        reader = Reader(self.manga, chapters, index, page, pages, self.saver)
+        await interaction.response.edit_message(content=pages[page], view=reader)
+        prefetch(client.network, chapters, index, self.saver)
+
+async def resolve(client: network.Client, chapter: backend.Chapter, saver: bool) -> list[str]:
+    """Get the pages of a chapter, reusing prefetched (or in-flight) requests."""
+    key = (chapter.id, saver)
+
+    if (pages := PAGES.get(key)) is None:
+        pages = await PAGE_FLIGHTS.run(key, lambda: chapter.pages(client, saver))
+        PAGES[key] = pages
+
+    return pages
 
-        self.chapter = new
-        self.page = 0
+async def warm(client: network.Client, chapter: backend.Chapter, saver: bool):
+    """Resolve the pages of a chapter, ignoring failures (they'll be retried on demand)."""
+    try:
+        await resolve(client, chapter, saver)
+    except Exception:
+        pass
 
-        chapter = self.chapters[self.chapter]
-        self.pages = await chapter.pages(self.session)
-        await interaction.response.edit_message(content=self.pages[self.page])
+def prefetch(client: network.Client, chapters: list[backend.Chapter], index: int, saver: bool):
+    """Start resolving the pages of the neighbouring chapters in the background."""
+    for neighbour in (index - 1, index + 1):
+        if 0 <= neighbour < len(chapters) and (chapters[neighbour].id, saver) not in PAGES:
+            task = asyncio.create_task(warm(client, chapters[neighbour], saver))
+            task.add_done_callback(PREFETCHES.discard)
+            PREFETCHES.add(task)
@@ -60,6 +60,21 @@ class AuthorAttributes(typing.TypedDict):
     createdAt: str
     updatedAt: str
 
+class ChapterAttributes(typing.TypedDict):
+    """The format of a ChapterAttributes object."""
+    title: str | None
+    volume: str | None
+    chapter: str | None
+    pages: int
+    translatedLanguage: str
+    uploader: str
+    externalUrl: str | None
+    version: int
+    createdAt: str
+    updatedAt: str
+    publishAt: str
+    readableAt: str
+
 class Relationship(Object, total=False):
     """The format of a Relationship object."""
     related: str
@@ -70,6 +85,11 @@ class Tag(Object):
     attributes: TagAttributes
     relationships: list[Relationship]
 
+class ChapterObject(Object):
+    """The format of a Chapter object."""
+    attributes: ChapterAttributes
+    relationships: list[Relationship]
+
 class Author(Object):
     """The format of an Author object."""
     attributes: AuthorAttributes
@@ -130,6 +150,22 @@ class CDNResponse(Payload):
     baseUrl: str
     chapter: Routes
 
+class AuthorList(Payload):
+    """The format of an AuthorList object."""
+    response: typing.Literal["collection"]
+    data: list[Author]
+    limit: int
+    offset: int
+    total: int
+
+class ChapterList(Payload):
+    """The format of a ChapterList object."""
+    response: typing.Literal["collection"]
+    data: list[ChapterObject]
+    limit: int
+    offset: int
+    total: int
+
 class MangaList(Payload):
     """The format of a MangaList object."""
     response: typing.Literal["collection"]
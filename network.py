@@ -0,0 +1,380 @@
+import email.utils as emailutils
+
+import dataclasses
+import contextlib
+import itertools
+import datetime
+import hashlib
+import pathlib
+import sqlite3
+import aiohttp
+import asyncio
+import logging
+import caches
+import random
+import typing
+import json
+import time
+import yarl
+
+# Requests per second (and burst size) for each host, matching their published limits where they have one.
+LIMITS = {
+    "api.mangadex.org": (5.0, 5),
+    "v2.jokeapi.dev": (2.0, 5)
+}
+
+DEFAULT_LIMIT = (10.0, 10)
+
+# Retries back off exponentially with full jitter and give up on long waits.
+RETRY_ATTEMPTS = 3
+RETRY_BASE = 0.5
+RETRY_CAP = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Each request earns a fraction of a retry (up to a reserve), so an
+# outage can't multiply the load on a host that is already struggling.
+RETRY_RATIO = 0.1
+RETRY_RESERVE = 10.0
+
+# Responses are kept in memory up to a byte budget, and optionally on disk as well.
+MEMORY_BUDGET = 32 * 1024 * 1024
+DISK_BUDGET = 256 * 1024 * 1024
+DISK_PATH = pathlib.Path(".cache/http.sqlite3")
+
+# Least recently used responses are evicted this many at a time.
+EVICTION_BATCH = 64
+
+# Only these headers are worth keeping alongside a cached body.
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+@dataclasses.dataclass
+class Host:
+    """Rate limiting, retry budgeting and statistics for a single host."""
+    name: str
+    rate: float
+    burst: int
+
+    tokens: float = dataclasses.field(init=False)
+    updated: float = dataclasses.field(default_factory=time.monotonic, init=False)
+    blocked: float = dataclasses.field(default=0.0, init=False)
+    budget: float = dataclasses.field(default=RETRY_RESERVE, init=False)
+    lock: asyncio.Lock = dataclasses.field(default_factory=asyncio.Lock, init=False)
+
+    waiting: int = dataclasses.field(default=0, init=False)
+    requests: int = dataclasses.field(default=0, init=False)
+    retries: int = dataclasses.field(default=0, init=False)
+    throttled: int = dataclasses.field(default=0, init=False)
+
+    def __post_init__(self):
+        self.tokens = float(self.burst)
+
+    async def acquire(self):
+        """Wait until the host's token bucket allows another request."""
+        self.waiting += 1
+
+        try:
+            # The lock is fair, so queued requests go out in the order they arrived.
+            async with self.lock:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+
+                    delay = max(self.blocked - now, (1 - self.tokens) / self.rate)
+                    if delay <= 0:
+                        break
+
+                    await asyncio.sleep(delay)
+
+                self.tokens -= 1
+                self.requests += 1
+                self.budget = min(RETRY_RESERVE, self.budget + RETRY_RATIO)
+        finally:
+            self.waiting -= 1
+
+    def block(self, seconds: float):
+        """Hold back every request to this host for the next `seconds` seconds."""
+        self.blocked = max(self.blocked, time.monotonic() + seconds)
+
+    def retry(self, attempt: int) -> bool:
+        """Spend part of the retry budget on another attempt, if there's any left."""
+        if attempt + 1 >= RETRY_ATTEMPTS or self.budget < 1:
+            return False
+
+        self.budget -= 1
+        self.retries += 1
+        return True
+
+@dataclasses.dataclass
+class Response:
+    """A fully read response, which may have come from the cache."""
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    # The Unix time after which the response must be revalidated.
+    expires: float = 0.0
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the response can be reused without asking the server."""
+        return time.time() < self.expires
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """Conditional request headers that revalidate this response."""
+        conditions = {}
+
+        if (tag := self.headers.get("ETag")) is not None:
+            conditions["If-None-Match"] = tag
+        if (modified := self.headers.get("Last-Modified")) is not None:
+            conditions["If-Modified-Since"] = modified
+
+        return conditions
+
+    async def json(self) -> typing.Any:
+        """Decode the body as JSON."""
+        return json.loads(self.body)
+
+    async def text(self) -> str:
+        """Decode the body as UTF-8 text."""
+        return self.body.decode()
+
+def lifetime(headers: typing.Mapping[str, str]) -> float | None:
+    """How long a response stays fresh for, or None if it mustn't be stored at all."""
+    directives = {}
+
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives or headers.get("Vary", "").strip() not in ("", "Accept-Encoding"):
+        return None
+    if "no-cache" in directives:
+        return 0.0
+
+    age = float(value) if (value := headers.get("Age", "")).isdigit() else 0.0
+
+    if (value := directives.get("max-age", "")).isdigit():
+        return max(0.0, float(value) - age)
+
+    if (value := headers.get("Expires")) is not None:
+        try:
+            when = emailutils.parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return 0.0
+
+    return 0.0
+
+class Disk:
+    """A SQLite database of responses that survives restarts."""
+    def __init__(self, path: pathlib.Path, budget: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.budget = budget
+
+        # SQLite calls are made from worker threads, one at a time.
+        self.lock = asyncio.Lock()
+
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, status INTEGER, headers TEXT, "
+            "body BLOB, expires REAL, used REAL)"
+        )
+
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+
+        # The total size of every stored body, kept up to date by `insert`.
+        self.size, = self.connection.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()
+
+    def select(self, key: str) -> Response | None:
+        """Read a response and mark it as recently used."""
+        with self.connection:
+            query = "SELECT status, headers, body, expires FROM responses WHERE key = ?"
+            row = self.connection.execute(query, (key,)).fetchone()
+
+            if row is None:
+                return None
+
+            self.connection.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+
+        status, headers, body, expires = row
+        return Response(status, json.loads(headers), body, expires)
+
+    def insert(self, key: str, response: Response):
+        """Store a response, evicting the least recently used ones if over budget."""
+        with self.connection:
+            replaced = self.connection.execute("SELECT LENGTH(body) FROM responses WHERE key = ?", (key,)).fetchone()
+            size = self.size - (replaced[0] if replaced is not None else 0) + len(response.body)
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response.status, json.dumps(response.headers), response.body, response.expires, time.time())
+            )
+
+            while size > self.budget:
+                query = "SELECT key, LENGTH(body) FROM responses ORDER BY used LIMIT ?"
+                victims = self.connection.execute(query, (EVICTION_BATCH,)).fetchall()
+
+                if not victims:
+                    break
+
+                for victim, length in victims:
+                    if size <= self.budget:
+                        break
+
+                    self.connection.execute("DELETE FROM responses WHERE key = ?", (victim,))
+                    size -= length
+
+        # Only counted once the transaction has committed.
+        self.size = size
+
+    async def read(self, key: str) -> Response | None:
+        """Read a response without blocking the event loop."""
+        async with self.lock:
+            return await asyncio.to_thread(self.select, key)
+
+    async def write(self, key: str, response: Response):
+        """Store a response without blocking the event loop."""
+        async with self.lock:
+            await asyncio.to_thread(self.insert, key, response)
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
+
+class Cache:
+    """A shared cache of responses, checked in memory before on disk."""
+    def __init__(self, disk: pathlib.Path | None):
+        self.memory = caches.LRU[str, Response](MEMORY_BUDGET, weigh=lambda response: len(response.body))
+        self.disk = Disk(disk, DISK_BUDGET) if disk is not None else None
+
+    async def read(self, key: str) -> Response | None:
+        """Look up a response, promoting it into memory if it was on disk."""
+        if (response := self.memory.get(key)) is None and self.disk is not None:
+            if (response := await self.disk.read(key)) is not None:
+                self.memory[key] = response
+
+        return response
+
+    async def write(self, key: str, response: Response):
+        """Store a response in every tier."""
+        self.memory[key] = response
+
+        if self.disk is not None:
+            await self.disk.write(key, response)
+
+def backoff(attempt: int) -> float:
+    """A jittered delay before the next attempt."""
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+def retry_after(response: aiohttp.ClientResponse) -> float | None:
+    """How long a response asks us to wait before trying again, if it says."""
+    if (value := response.headers.get("Retry-After")) is not None:
+        if value.isdigit():
+            return float(value)
+
+        try:
+            when = emailutils.parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    # MangaDex sends a Unix timestamp instead.
+    if (value := response.headers.get("X-RateLimit-Retry-After")) is not None and value.isdigit():
+        return max(0.0, int(value) - time.time())
+
+    return None
+
+class Client:
+    """Sends HTTP requests with per-host rate limiting, retries and caching."""
+    def __init__(self, session: aiohttp.ClientSession, disk: pathlib.Path | None = None):
+        self.logger = logging.getLogger(f"bakerbot.{__name__}")
+        self.session = session
+        self.hosts: dict[str, Host] = {}
+        self.cache = Cache(disk)
+
+    def close(self):
+        """Close the on-disk cache, if there is one."""
+        if self.cache.disk is not None:
+            self.cache.disk.close()
+
+    def host(self, name: str) -> Host:
+        """Get (or create) the state for a host."""
+        if name not in self.hosts:
+            rate, burst = LIMITS.get(name, DEFAULT_LIMIT)
+            self.hosts[name] = Host(name, rate, burst)
+
+        return self.hosts[name]
+
+    @contextlib.asynccontextmanager
+    async def get(self, url: str | yarl.URL, **kwargs) -> typing.AsyncIterator[Response]:
+        """Send a GET request (or reuse a cached response), raising if it fails."""
+        target = yarl.URL(url)
+        target = target.extend_query(params) if (params := kwargs.get("params")) else target
+        statistics = caches.statistics(f"http_{target.host}")
+
+        # URLs can carry API keys, which shouldn't end up on disk.
+        key = hashlib.sha256(str(target).encode()).hexdigest()
+        cached = await self.cache.read(key)
+
+        if cached is not None and cached.fresh:
+            statistics.hits += 1
+            yield cached
+            return
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.update(cached.validators if cached is not None else {})
+        response, refreshed = await self.fetch(url, headers=headers, **kwargs)
+
+        if response.status == 304 and cached is not None:
+            statistics.hits += 1
+            cached.headers.update(response.headers)
+            response = Response(cached.status, cached.headers, cached.body)
+        else:
+            statistics.misses += 1
+
+        if (seconds := lifetime(refreshed)) is not None and response.status == 200 and (seconds > 0 or response.validators):
+            response.expires = time.time() + seconds
+            await self.cache.write(key, response)
+
+        yield response
+
+    async def fetch(self, url: str | yarl.URL, **kwargs) -> tuple[Response, typing.Mapping[str, str]]:
+        """Send a GET request to the network, returning the response and all of its headers."""
+        host = self.host(yarl.URL(url).host or "")
+
+        for attempt in itertools.count():
+            await host.acquire()
+
+            try:
+                response = await self.session.get(url, raise_for_status=False, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not host.retry(attempt):
+                    raise
+
+                await asyncio.sleep(backoff(attempt))
+                continue
+
+            if response.status not in RETRY_STATUSES:
+                break
+
+            delay = retry_after(response)
+            if response.status == 429:
+                host.throttled += 1
+                host.block(delay if delay is not None else backoff(attempt))
+
+            if (delay is not None and delay > RETRY_CAP) or not host.retry(attempt):
+                break
+
+            self.logger.warning(f"Retrying request to {host.name} after HTTP {response.status}.")
+            response.release()
+            await asyncio.sleep(delay if delay is not None else backoff(attempt))
+
+        try:
+            response.raise_for_status()
+            headers = {name: value for name in STORED_HEADERS if (value := response.headers.get(name)) is not None}
+            return Response(response.status, headers, await response.read()), response.headers.copy()
+        finally:
+            response.release()
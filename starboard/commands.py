@@ -1,17 +1,38 @@
 import discord.app_commands as application
 import discord.ext.commands as commands
+import discord.ext.tasks as tasks
 import starboard.tenor as tenor
 
 import urllib.parse
+import dataclasses
+import collections
+import contextlib
 import database
-import aiohttp
+import datetime
+import tempfile
+import network
+import asyncio
+import logging
 import discord
 import colours
+import caches
 import typing
+import limits
 import icons
+import views
+import gzip
 import bot
 import re
 
+MESSAGE_CACHE_SIZE = 1024
+COUNTER_CACHE_SIZE = 16384
+SETTLE_WINDOW = 1.0
+FLUSH_INTERVAL = 10.0
+EDIT_INTERVAL = 5.0
+EDIT_SPACING = 1.0
+BACKFILL_WALKERS = 4
+BACKFILL_PAGE = 100
+
 def sanitise(url: str | None) -> str | None:
     """Sanitise attachment URLs (eg. strip query parameters off of Discord CDN URLs)."""
     if url is None:
@@ -28,7 +49,33 @@ def sanitise(url: str | None) -> str | None:
         fragment
     ))
 
-async def package(session: aiohttp.ClientSession, message: discord.Message) -> discord.Embed:
+def tally(message: discord.Message, target: str) -> int:
+    """Count the number of `target` reactions on a message."""
+    reaction = next(filter(lambda reaction: str(reaction.emoji) == target, message.reactions), None)
+    return reaction.count if reaction is not None else 0
+
+@dataclasses.dataclass
+class Progress:
+    """The results of a starboard backfill."""
+    scanned: int = 0
+    published: int = 0
+    updated: int = 0
+
+async def owner(interaction: discord.Interaction) -> bool:
+    """Check whether the user is the owner of the bot."""
+    return await interaction.client.is_owner(interaction.user) # type: ignore
+
+def name(guild: discord.Guild, id: int) -> str:
+    """Get the name of a member or channel in a guild, without making any requests."""
+    if (member := guild.get_member(id)) is not None:
+        return member.display_name
+
+    if (channel := guild.get_channel_or_thread(id)) is not None:
+        return channel.name
+
+    return str(id)
+
+async def package(client: network.Client, message: discord.Message) -> discord.Embed:
     """Package a message into a starboard embed."""
     package = discord.Embed(colour=colours.REGULAR, timestamp=message.created_at)
     package.set_author(name=message.author.display_name, icon_url=message.author.display_avatar.url)
@@ -46,7 +93,7 @@ async def package(session: aiohttp.ClientSession, message: discord.Message) -> d
         elif embed.type == "image" and embed.url not in re.findall(r"\|\|(.+?)\|\|", message.content):
             package.set_image(url=embed.url)
             package.description = ""
-        elif embed.type == "gifv" and embed.url is not None and (gif := await tenor.raw(session, embed.url)) is not None:
+        elif embed.type == "gifv" and embed.url is not None and (gif := await tenor.raw(client, embed.url)) is not None:
             package.set_image(url=gif)
             package.description = ""
 
@@ -68,10 +115,60 @@ async def package(session: aiohttp.ClientSession, message: discord.Message) -> d
 
 @application.guild_only()
 class Starboard(commands.GroupCog):
-    def __init__(self, bot: bot.Bot):
+    def __init__(self, bot: bot.Bot, window: float = SETTLE_WINDOW):
         super().__init__()
+        self.logger = logging.getLogger(f"bakerbot.{__package__}")
         self.bot = bot
 
+        # Bursts of reactions on a message are batched into a single
+        # pass that runs `window` seconds after the first one arrives.
+        self.window = window
+        self.pending: dict[int, asyncio.Task] = {}
+        self.dirty: set[int] = set()
+
+        # Messages fetched over REST aren't kept in the gateway cache,
+        # so remember them along with their reaction counts ourselves.
+        self.messages = caches.LRU[int, discord.Message](MESSAGE_CACHE_SIZE, caches.statistics("starboard_messages"))
+        self.counts = caches.LRU[int, int](COUNTER_CACHE_SIZE)
+        self.posts = caches.LRU[int, int](COUNTER_CACHE_SIZE)
+
+        # Pending starboard post edits, keyed by post ID.
+        self.revisions: dict[int, str] = {}
+        self.editing: dict[int, asyncio.Task] = {}
+        self.locks: dict[int, asyncio.Lock] = {}
+
+        # Running backfills, keyed by guild ID.
+        self.backfills: dict[int, asyncio.Task[Progress]] = {}
+
+        # Live passes and backfills both check whether a message is on the starboard
+        # before posting it, so they take turns per message (and count who's waiting).
+        self.claims: dict[int, asyncio.Lock] = {}
+        self.claimants = collections.Counter[int]()
+
+    async def cog_load(self):
+        """Start periodically flushing queued database writes."""
+        self.flush.start()
+
+    async def cog_unload(self):
+        """Let in-flight reaction passes finish and flush their writes before unloading."""
+        for task in self.backfills.values():
+            task.cancel()
+
+        # Backfills can be resumed from their checkpoints later on.
+        await asyncio.gather(*self.backfills.values(), return_exceptions=True)
+        await asyncio.gather(*self.pending.values(), return_exceptions=True)
+        await asyncio.gather(*self.editing.values(), return_exceptions=True)
+        self.flush.cancel()
+        await database.StarboardMessage.flush(self.bot.pool)
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush(self):
+        """Write queued starboard messages to the database."""
+        try:
+            await database.StarboardMessage.flush(self.bot.pool)
+        except Exception:
+            self.logger.exception("Failed to flush starboard messages, retrying later.")
+
     @application.command(description="Query the current status of the starboard.")
     async def status(self, interaction: discord.Interaction):
         guild = typing.cast(discord.Guild, interaction.guild)
@@ -106,46 +203,425 @@ class Starboard(commands.GroupCog):
         await config.write(self.bot.pool)
         await interaction.response.send_message("Guild configuration saved.")
 
-    @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        """Global starboard reaction handler."""
-        if payload.guild_id is None or (config := await database.GuildConfiguration.read(self.bot.pool, payload.guild_id)) is None:
-            return
+    @application.command(description="Scan channel history for messages that belong on the starboard.")
+    @application.describe(days="Only scan messages sent in the last few days.  Scans everything if unset.")
+    @application.describe(restart="Discard the progress of previous scans and start from the newest messages again.")
+    @application.check(owner)
+    async def backfill(self, interaction: discord.Interaction, days: application.Range[int, 1, None] | None = None, restart: bool = False):
+        guild = typing.cast(discord.Guild, interaction.guild)
+        config = await database.GuildConfiguration.read(self.bot.pool, guild.id)
 
-        threshold = config.starboard_reaction_threshold
-        identifier = config.starboard_channel_id
-        target = config.starboard_reaction_string
+        if config is None or None in (config.starboard_reaction_threshold, config.starboard_channel_id, config.starboard_reaction_string):
+            return await interaction.response.send_message("The starboard is not fully configured in this guild.")
+        if guild.id in self.backfills:
+            return await interaction.response.send_message("A backfill is already running in this guild.")
+
+        await interaction.response.send_message("Backfill started, this may take a while.")
+
+        if restart:
+            await database.StarboardCheckpoint.clear(self.bot.pool, guild.id)
+
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=days) if days is not None else None
+        self.backfills[guild.id] = asyncio.create_task(self.scan(guild, config, cutoff))
+
+        try:
+            progress = await self.backfills[guild.id]
+        finally:
+            del self.backfills[guild.id]
+
+        # The interaction token may well have expired by now.
+        if isinstance(interaction.channel, discord.abc.Messageable):
+            await interaction.channel.send(
+                f"Backfill complete: scanned {progress.scanned} messages, "
+                f"posted {progress.published} and updated {progress.updated}."
+            )
+
+    @application.command(description="Browse the most starred messages in this guild.")
+    async def top(self, interaction: discord.Interaction):
+        guild = typing.cast(discord.Guild, interaction.guild)
+        await interaction.response.defer(thinking=True)
+        await database.StarboardMessage.flush(self.bot.pool)
+
+        paginator = views.LazyPaginator(
+            lambda message: (
+                limits.limit(f"{message.reactions} - {message.content or 'No content.'}", limits.SELECT_LABEL),
+                limits.limit(f"By {name(guild, message.author_id)} in #{name(guild, message.channel_id)}", limits.SELECT_DESCRIPTION)
+            ),
+
+            lambda after, limit: database.StarboardMessage.top(self.bot.pool, guild.id, after, limit)
+        )
+
+        if not await paginator.start():
+            return await interaction.followup.send("No messages have been starred yet.")
+
+        await interaction.followup.send(view=paginator)
+
+        if (message := await paginator.wait()) is not None:
+            link = f"https://discord.com/channels/{message.guild_id}/{message.channel_id}/{message.message_id}"
+            await interaction.edit_original_response(content=f"**{message.reactions}** reactions: {link}", view=None)
+
+    @application.command(description="Search the content of starred messages in this guild.")
+    @application.describe(text="The words to search for.  Supports \"quoted phrases\", or and -exclusions.")
+    async def search(self, interaction: discord.Interaction, text: str):
+        guild = typing.cast(discord.Guild, interaction.guild)
+        await interaction.response.defer(thinking=True)
+        await database.StarboardMessage.flush(self.bot.pool)
+
+        paginator = views.LazyPaginator(
+            lambda match: (
+                limits.limit(match.headline.replace("**", "") or "No content.", limits.SELECT_LABEL),
+                limits.limit(f"{match.message.reactions} reactions, by {name(guild, match.message.author_id)}", limits.SELECT_DESCRIPTION)
+            ),
+
+            lambda after, limit: database.StarboardMatch.search(self.bot.pool, guild.id, text, after, limit)
+        )
+
+        if not await paginator.start():
+            return await interaction.followup.send("No starred messages matched your search.")
+
+        await interaction.followup.send(view=paginator)
+
+        if (match := await paginator.wait()) is not None:
+            message = match.message
+            link = f"https://discord.com/channels/{message.guild_id}/{message.channel_id}/{message.message_id}"
+            content = f"{limits.limit(match.headline, limits.MESSAGE_CHARACTERS - len(link) - 1)}\n{link}"
+            await interaction.edit_original_response(content=content, view=None, allowed_mentions=discord.AllowedMentions.none())
+
+    @application.command(description="Export this guild's starboard as a compressed file.")
+    @application.describe(format="The format of the exported file.")
+    @application.checks.has_permissions(administrator=True)
+    async def export(self, interaction: discord.Interaction, format: typing.Literal["jsonl", "csv"] = "jsonl"):
+        guild = typing.cast(discord.Guild, interaction.guild)
+        await interaction.response.defer(thinking=True)
+        await database.StarboardMessage.flush(self.bot.pool)
+
+        # Rows are compressed straight onto disk as they arrive from Postgres.
+        with tempfile.TemporaryFile() as file:
+            with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                await database.StarboardMessage.export(self.bot.pool, guild.id, format, archive)
+
+            if file.tell() > guild.filesize_limit:
+                return await interaction.followup.send("The export is too large to upload to this guild.")
+
+            file.seek(0)
+            await interaction.followup.send(file=discord.File(file, filename=f"starboard-{guild.id}.{format}.gz"))
+
+    @application.command(description="Rank this guild's members by the number of stars they've received.")
+    async def leaderboard(self, interaction: discord.Interaction):
+        guild = typing.cast(discord.Guild, interaction.guild)
+        await interaction.response.defer(thinking=True)
+        await database.StarboardMessage.flush(self.bot.pool)
+
+        paginator = views.LazyPaginator(
+            lambda author: (
+                limits.limit(name(guild, author.author_id), limits.SELECT_LABEL),
+                f"{author.stars} stars across {author.messages} messages."
+            ),
+
+            lambda after, limit: database.StarboardAuthor.ranking(self.bot.pool, guild.id, after, limit)
+        )
+
+        if not await paginator.start():
+            return await interaction.followup.send("No messages have been starred yet.")
+
+        await interaction.followup.send(view=paginator)
+
+        if (author := await paginator.wait()) is not None:
+            summary = f"<@{author.author_id}> has received **{author.stars}** stars across **{author.messages}** messages."
+            await interaction.edit_original_response(content=summary, view=None, allowed_mentions=discord.AllowedMentions.none())
+
+    def relevant(self, config: database.GuildConfiguration | None, payload: discord.RawReactionActionEvent) -> bool:
+        """Check whether a reaction event could affect the starboard (without any I/O)."""
+        return (
+            config is not None and
+            config.starboard_reaction_threshold is not None and
+            config.starboard_channel_id is not None and
+            config.starboard_reaction_string is not None and
+            payload.channel_id != config.starboard_channel_id and
+            str(payload.emoji) == config.starboard_reaction_string
+        )
+
+    async def resolve(self, channel: discord.abc.Messageable, id: int) -> discord.Message:
+        """Get a message from the gateway cache, the fetch cache or Discord (in that order)."""
+        if (message := discord.utils.get(self.bot.cached_messages, id=id)) is not None:
+            return message
+
+        if (message := self.messages.get(id)) is not None:
+            return message
 
-        if threshold is None or identifier is None or target is None or payload.channel_id == identifier:
+        message = await channel.fetch_message(id)
+        self.messages[id] = message
+        return message
+
+    def schedule(self, payload: discord.RawReactionActionEvent):
+        """Coalesce reaction events for a message into a single processing pass."""
+        self.dirty.add(payload.message_id)
+
+        if payload.message_id not in self.pending:
+            self.pending[payload.message_id] = asyncio.create_task(self.settle(payload))
+
+    async def settle(self, payload: discord.RawReactionActionEvent):
+        """Process a message once its reactions have settled."""
+        try:
+            # Events that arrive while a pass is running trigger another pass.
+            while payload.message_id in self.dirty:
+                await asyncio.sleep(self.window)
+                self.dirty.discard(payload.message_id)
+
+                try:
+                    await self.process(payload)
+                except Exception:
+                    self.logger.exception(f"Failed to process reactions for message {payload.message_id}.")
+        finally:
+            del self.pending[payload.message_id]
+
+    def revise(self, channel: discord.TextChannel, post: int, content: str):
+        """Queue an edit of a starboard post, coalescing it with any edits already queued."""
+        self.revisions[post] = content
+
+        if post not in self.editing:
+            self.editing[post] = asyncio.create_task(self.edit(channel, post))
+
+    async def edit(self, channel: discord.TextChannel, post: int):
+        """Apply the latest revision of a starboard post until none are left."""
+        lock = self.locks.setdefault(channel.id, asyncio.Lock())
+
+        try:
+            while (content := self.revisions.pop(post, None)) is not None:
+                # Edits to the same channel share a rate limit bucket, so space them out.
+                async with lock:
+                    await channel.get_partial_message(post).edit(content=content)
+                    await asyncio.sleep(EDIT_SPACING)
+
+                # Any revisions that pile up in the meantime collapse into the next edit.
+                await asyncio.sleep(EDIT_INTERVAL)
+        except discord.HTTPException:
+            self.logger.exception(f"Failed to edit starboard post {post}.")
+        finally:
+            self.revisions.pop(post, None)
+            del self.editing[post]
+
+    async def process(self, payload: discord.RawReactionActionEvent):
+        """Send a message to the starboard (or update it) using the latest reaction count."""
+        guild = typing.cast(int, payload.guild_id)
+        config = await database.GuildConfiguration.read(self.bot.pool, guild)
+        if not self.relevant(config, payload):
             return
 
+        config = typing.cast(database.GuildConfiguration, config)
+        threshold = typing.cast(int, config.starboard_reaction_threshold)
+        target = typing.cast(str, config.starboard_reaction_string)
+
         channel = self.bot.get_channel(payload.channel_id)
         if not isinstance(channel, discord.abc.Messageable):
             return
 
-        message = await channel.fetch_message(payload.message_id)
-        reaction = next(filter(lambda reaction: str(reaction.emoji) == target, message.reactions), None)
+        # Counters are kept up to date by the add and remove events, so
+        # a message only needs to be fetched the first time it is seen.
+        if (count := self.counts.get(payload.message_id)) is None:
+            message = await self.resolve(channel, payload.message_id)
+            count = tally(message, target)
+            self.counts[payload.message_id] = count
 
-        if reaction is None:
+        # Messages that are already on the starboard keep their count
+        # up to date, even if it has dropped below the threshold since.
+        if count < threshold and payload.message_id not in self.posts:
             return
 
-        if reaction.count >= threshold:
+        async with self.claim(payload.message_id):
             if (cache := await database.StarboardMessage.read(self.bot.pool, payload.message_id)) is not None:
-                cache.reactions = reaction.count
-            elif isinstance((starboard := self.bot.get_channel(identifier)), discord.abc.Messageable):
-                await starboard.send(embed=await package(self.bot.session, message))
-
-            result = cache or database.StarboardMessage(
-                payload.message_id,
-                message.author.id,
-                payload.channel_id,
-                payload.guild_id,
-                message.reference.message_id if message.reference is not None else None,
-                message.created_at,
-                message.content,
-                [url for attachment in message.attachments if (url := sanitise(attachment.url)) is not None],
-                [sticker.url for sticker in message.stickers],
-                reaction.count
-            )
+                return await self.update(config, cache, count)
+
+            if count < threshold:
+                return
+
+            message = await self.resolve(channel, payload.message_id)
+            await self.publish(config, message, count)
+
+    @contextlib.asynccontextmanager
+    async def claim(self, message: int) -> typing.AsyncIterator[None]:
+        """Hold the lock that serialises checking for and posting a message to the starboard."""
+        lock = self.claims.setdefault(message, asyncio.Lock())
+        self.claimants[message] += 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            self.claimants[message] -= 1
 
+            if not self.claimants[message]:
+                del self.claimants[message]
+                del self.claims[message]
+
+    async def update(self, config: database.GuildConfiguration, cache: database.StarboardMessage, count: int):
+        """Update the reaction count of a message that is already on the starboard."""
+        if cache.post_id is not None:
+            self.posts[cache.message_id] = cache.post_id
+
+        if cache.reactions == count:
+            return
+
+        cache.reactions = count
+        await cache.stage(self.bot.pool)
+
+        starboard = self.bot.get_channel(typing.cast(int, config.starboard_channel_id))
+        if cache.post_id is not None and isinstance(starboard, discord.TextChannel):
+            self.revise(starboard, cache.post_id, f"{config.starboard_reaction_string} **{count}**")
+
+    async def publish(self, config: database.GuildConfiguration, message: discord.Message, count: int):
+        """Send a message to the starboard for the first time."""
+        starboard = self.bot.get_channel(typing.cast(int, config.starboard_channel_id))
+        post = None
+
+        if isinstance(starboard, discord.abc.Messageable):
+            post = await starboard.send(f"{config.starboard_reaction_string} **{count}**", embed=await package(self.bot.network, message))
+            self.posts[message.id] = post.id
+
+        result = database.StarboardMessage(
+            message.id,
+            message.author.id,
+            message.channel.id,
+            config.guild_id,
+            message.reference.message_id if message.reference is not None else None,
+            message.created_at,
+            message.content,
+            [url for attachment in message.attachments if (url := sanitise(attachment.url)) is not None],
+            [sticker.url for sticker in message.stickers],
+            count,
+            post.id if post is not None else None
+        )
+
+        # A post that was never recorded would be sent again after a crash,
+        # so only rows without one (or later count updates) are buffered.
+        if post is not None:
             await result.write(self.bot.pool)
+        else:
+            await result.stage(self.bot.pool)
+
+    async def scan(self, guild: discord.Guild, config: database.GuildConfiguration, cutoff: datetime.datetime | None) -> Progress:
+        """Walk the history of every channel in a guild, resuming from any checkpoints."""
+        checkpoints = await database.StarboardCheckpoint.read(self.bot.pool, guild.id)
+        queue = asyncio.Queue[database.StarboardCheckpoint]()
+        progress = Progress()
+
+        for channel in guild.text_channels:
+            checkpoint = checkpoints.get(channel.id) or database.StarboardCheckpoint(guild.id, channel.id, None, False)
+
+            if channel.id != config.starboard_channel_id and not checkpoint.completed:
+                queue.put_nowait(checkpoint)
+
+        # Discord.py waits on the rate limit buckets for us, so the
+        # number of walkers just bounds how many requests are queued up.
+        await asyncio.gather(*(self.walk(guild, config, cutoff, queue, progress) for _ in range(BACKFILL_WALKERS)))
+        await database.StarboardMessage.flush(self.bot.pool)
+        return progress
+
+    async def walk(self, guild: discord.Guild, config: database.GuildConfiguration, cutoff: datetime.datetime | None, queue: asyncio.Queue[database.StarboardCheckpoint], progress: Progress):
+        """Walk channels from the queue until it's empty, checkpointing after every page."""
+        while not queue.empty():
+            checkpoint = queue.get_nowait()
+
+            # The channel may have been deleted since the backfill started.
+            if not isinstance(channel := guild.get_channel(checkpoint.channel_id), discord.TextChannel):
+                self.logger.info(f"Skipping channel {checkpoint.channel_id} during backfill, it no longer exists.")
+                continue
+
+            before = discord.Object(checkpoint.before_id) if checkpoint.before_id is not None else None
+            page: list[discord.Message] = []
+            checkpoint.completed = True
+
+            try:
+                async for message in channel.history(limit=None, before=before, oldest_first=False):
+                    if cutoff is not None and message.created_at < cutoff:
+                        checkpoint.completed = False
+                        break
+
+                    page.append(message)
+
+                    if len(page) == BACKFILL_PAGE:
+                        await self.sweep(config, page, progress)
+                        await self.checkpoint(checkpoint, page[-1].id)
+                        page.clear()
+
+                await self.sweep(config, page, progress)
+                checkpoint.before_id = page[-1].id if page else checkpoint.before_id
+            except discord.Forbidden:
+                self.logger.info(f"Skipping channel {channel.id} during backfill, history is not readable.")
+            except discord.HTTPException as error:
+                # The rest of the channel is left for the next backfill to resume.
+                self.logger.warning(f"Stopping backfill of channel {channel.id} early: {error}")
+                checkpoint.completed = False
+
+            await self.checkpoint(checkpoint, checkpoint.before_id)
+
+    async def checkpoint(self, checkpoint: database.StarboardCheckpoint, before: int | None):
+        """Record progress through a channel, once everything swept so far has been written."""
+        await database.StarboardMessage.flush(self.bot.pool)
+        checkpoint.before_id = before
+        await checkpoint.write(self.bot.pool)
+
+    async def sweep(self, config: database.GuildConfiguration, page: list[discord.Message], progress: Progress):
+        """Post or update every message in a page of history that meets the threshold."""
+        threshold = typing.cast(int, config.starboard_reaction_threshold)
+        target = typing.cast(str, config.starboard_reaction_string)
+        candidates = {message.id: (message, count) for message in page if (count := tally(message, target)) >= threshold}
+        known = await database.StarboardMessage.known(self.bot.pool, list(candidates)) if candidates else {}
+        progress.scanned += len(page)
+
+        for id, (message, count) in candidates.items():
+            self.counts[id] = count
+
+            if (cache := known.get(id)) is not None:
+                if cache.reactions != count:
+                    await self.update(config, cache, count)
+                    progress.updated += 1
+
+                continue
+
+            # A live pass may have posted the message since it was looked up.
+            async with self.claim(id):
+                if (cache := await database.StarboardMessage.read(self.bot.pool, id)) is None:
+                    await self.publish(config, message, count)
+                    progress.published += 1
+                elif cache.reactions != count:
+                    await self.update(config, cache, count)
+                    progress.updated += 1
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        """Global starboard reaction handler."""
+        if payload.guild_id is None:
+            return
+
+        config = await database.GuildConfiguration.read(self.bot.pool, payload.guild_id)
+        if not self.relevant(config, payload):
+            return
+
+        if (count := self.counts.get(payload.message_id)) is not None:
+            self.counts[payload.message_id] = count + 1
+
+        self.schedule(payload)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        """Keep reaction counters up to date when reactions are removed."""
+        if payload.guild_id is None or (count := self.counts.get(payload.message_id)) is None:
+            return
+
+        config = await database.GuildConfiguration.read(self.bot.pool, payload.guild_id)
+        if self.relevant(config, payload):
+            self.counts[payload.message_id] = max(0, count - 1)
+            self.schedule(payload)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        """Forget the counter and fetched copy of a message that has had its reactions cleared."""
+        self.counts.pop(payload.message_id, None)
+        self.messages.pop(payload.message_id, None)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
+        """Forget the counter and fetched copy of a message that has had an emoji cleared."""
+        self.counts.pop(payload.message_id, None)
+        self.messages.pop(payload.message_id, None)
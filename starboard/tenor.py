@@ -1,8 +1,17 @@
 import keychain
-import aiohttp
+import network
+import asyncio
+import caches
 import typing
 import re
 
+# The posts endpoint accepts at most 50 IDs per request.
+BATCH_SIZE = 50
+BATCH_DELAY = 0.05
+
+# Post IDs map to the same GIF forever, so the lifetime only bounds staleness.
+CACHE = caches.LRU[str, str | None](4096, caches.statistics("tenor"), lifetime=24 * 60 * 60)
+
 class MediaFormat(typing.TypedDict):
     """The format of a Media Format object."""
     url: str
@@ -29,19 +38,70 @@ class Payload(typing.TypedDict):
     """The format of the payload from the post endpoint."""
     results: list[Response]
 
-async def raw(session: aiohttp.ClientSession, url: str) -> str | None:
-    """Convert a Tenor item URL into a raw GIF URL."""
-    match = re.match(r"^https://tenor\.com/view/(-?([A-Za-z0-9]+))+$", url)
+class Batcher:
+    """Merges concurrent post lookups into as few API requests as possible."""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.futures: dict[str, asyncio.Future[str | None]] = {}
+        self.queue: list[str] = []
+        self.task: asyncio.Task | None = None
 
-    if match is None:
-        return None
+    async def lookup(self, client: network.Client, id: str) -> str | None:
+        """Resolve a post ID into a raw GIF URL."""
+        if (url := CACHE.get(id, caches.MISSING)) is not caches.MISSING:
+            return url
+
+        # Lookups for an ID that is already queued or in flight share its future.
+        if id not in self.futures:
+            self.futures[id] = asyncio.get_running_loop().create_future()
+            self.queue.append(id)
+
+            if self.task is None:
+                self.task = asyncio.create_task(self.dispatch(client))
+
+        return await asyncio.shield(self.futures[id])
+
+    async def dispatch(self, client: network.Client):
+        """Wait for lookups to accumulate, then send them off in batches."""
+        await asyncio.sleep(self.delay)
+        queue, self.queue, self.task = self.queue, [], None
+
+        for begin in range(0, len(queue), BATCH_SIZE):
+            batch = queue[begin:begin + BATCH_SIZE]
 
+            try:
+                results = await posts(client, batch)
+            except Exception as error:
+                for id in batch:
+                    self.futures.pop(id).set_exception(error)
+            else:
+                for id in batch:
+                    url = results.get(id)
+                    CACHE[id] = url
+                    self.futures.pop(id).set_result(url)
+
+async def posts(client: network.Client, ids: list[str]) -> dict[str, str | None]:
+    """Request raw GIF URLs for a set of post IDs."""
     params = {
         "key": keychain.TENOR_KEY,
-        "ids": match.group(2)
+        "ids": ",".join(ids)
     }
 
-    async with session.get("https://tenor.googleapis.com/v2/posts", params=params) as response:
+    async with client.get("https://tenor.googleapis.com/v2/posts", params=params) as response:
         payload = typing.cast(Payload, await response.json())
-        format = payload["results"][0]["media_formats"].get("gif", None)
-        return format["url"] if format is not None else None
+
+        return {
+            result["id"]: format["url"] if (format := result["media_formats"].get("gif")) is not None else None
+            for result in payload["results"]
+        }
+
+async def raw(client: network.Client, url: str) -> str | None:
+    """Convert a Tenor item URL into a raw GIF URL."""
+    match = re.match(r"^https://tenor\.com/view/(-?([A-Za-z0-9]+))+$", url)
+
+    if match is None:
+        return None
+
+    return await BATCHER.lookup(client, match.group(2))
+
+BATCHER = Batcher(BATCH_DELAY)
@@ -1,10 +1,33 @@
 import discord
+import binascii
 import typing
+import base64
 import limits
+import caches
 import debug
+import uuid
+import abc
+import re
 
 T = typing.TypeVar("T")
 
+# How many pages of rendered select options each paginator keeps around.
+RENDERED_PAGES = 8
+
+# Every stateless custom ID has this shape, though only subclasses (which fix the prefix) are registered.
+STATELESS_TEMPLATE = r"(?P<prefix>[^:]+):(?P<version>\d+):(?P<state>.*)"
+
+def compress(identifier: str) -> str:
+    """Shorten a UUID to 22 URL-safe characters for use in a custom ID."""
+    return base64.urlsafe_b64encode(uuid.UUID(identifier).bytes).rstrip(b"=").decode()
+
+def decompress(compressed: str) -> str:
+    """Expand a compressed UUID back into its usual form."""
+    try:
+        return str(uuid.UUID(bytes=base64.urlsafe_b64decode(f"{compressed}==")))
+    except (binascii.Error, ValueError) as error:
+        raise ValueError(f"{compressed!r} is not a compressed UUID") from error
+
 class View(discord.ui.View):
     """A discord.ui.View with a default error handler and custom ID methods."""
     def stringify(self, *objects) -> str:
@@ -28,6 +51,7 @@ class Paginator(View, typing.Generic[T]):
         self.describer = describer
         self.options = options
         self.selection = None
+        self.rendered = caches.LRU[int, list[discord.SelectOption]](RENDERED_PAGES, caches.statistics("paginator_pages"))
 
         # The current page can be extracted from
         # the values of the currently active options.
@@ -37,6 +61,25 @@ class Paginator(View, typing.Generic[T]):
         """Returns the list of menus."""
         return self.children[4:] # type: ignore
 
+    def render(self, page: int) -> list[discord.SelectOption]:
+        """Describe every option on a page, reusing the result of previous visits."""
+        if (rendered := self.rendered.get(page)) is None:
+            block = limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1)
+            rendered = []
+
+            for offset, option in enumerate(self.options[block * page:block * (page + 1)]):
+                label, description = self.describer(option)
+                rendered.append(discord.SelectOption(label=label, value=str(block * page + offset), description=description))
+
+            self.rendered[page] = rendered
+
+        return rendered
+
+    def pages(self) -> int:
+        """The number of pages of options (at least one, even if it's empty)."""
+        block = limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1)
+        return max(1, -(-len(self.options) // block))
+
     def set_menu_options(self, page: int):
         """Set the menu options for the current page."""
         for _ in range(limits.VIEW_ITEMS_PER_ROW - 1 - len(self.get_menus())):
@@ -44,14 +87,10 @@ class Paginator(View, typing.Generic[T]):
             menu.callback = self.select
             self.add_item(menu)
 
-        for index, menu in enumerate(self.get_menus()):
-            menu.options.clear()
-            begin = limits.SELECT_OPTIONS * (page * (limits.VIEW_ITEMS_PER_ROW - 1) + index)    
-            end = begin + limits.SELECT_OPTIONS
+        rendered = self.render(page)
 
-            for offset, option in enumerate(self.options[begin:end]):
-                label, description = self.describer(option)
-                menu.add_option(label=label, value=str(begin + offset), description=description)
+        for index, menu in enumerate(self.get_menus()):
+            menu.options = rendered[limits.SELECT_OPTIONS * index:limits.SELECT_OPTIONS * (index + 1)]
 
             if not menu.options:
                 self.remove_item(menu)
@@ -105,7 +144,7 @@ class Paginator(View, typing.Generic[T]):
             return await interaction.response.defer()
 
         block = limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1)
-        page = min((len(self.options) // block) - 1, (int(options[0].value) // block) + 1)
+        page = min(self.pages() - 1, (int(options[0].value) // block) + 1)
         self.set_menu_options(page)
 
         await interaction.response.edit_message(view=self)
@@ -113,8 +152,92 @@ class Paginator(View, typing.Generic[T]):
     @discord.ui.button(label="Last", row=4)
     async def last(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Move to the last page."""
+        self.set_menu_options(self.pages() - 1)
+
+        await interaction.response.edit_message(view=self)
+
+class LazyPaginator(Paginator[T]):
+    """Let users select from a set of options that are fetched a page at a time."""
+    def __init__(self, describer: typing.Callable[[T], tuple[str, str]], source: typing.Callable[[T | None, int], typing.Awaitable[list[T]]]):
+        # The source is called with the last option fetched so far (or None) and
+        # a page size, which suits keyset pagination over database queries.
+        self.source = source
+        self.exhausted = False
+        self.options: list[T] = []
+        super().__init__(describer, self.options)
+
+        # Jumping to the end would mean fetching every page.
+        self.last.disabled = True
+
+    async def load(self, page: int) -> bool:
+        """Fetch options until `page` is available, returning whether it exists."""
         block = limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1)
-        page = max(0, (len(self.options) // block) - 1)
-        self.set_menu_options(page)
 
+        while not self.exhausted and len(self.options) < block * (page + 1):
+            fetched = await self.source(self.options[-1] if self.options else None, block)
+            self.exhausted = len(fetched) < block
+            self.options.extend(fetched)
+
+        return len(self.options) > block * page
+
+    def render(self, page: int) -> list[discord.SelectOption]:
+        """Describe every option on a page, only remembering pages that are fully fetched."""
+        rendered = super().render(page)
+
+        if not self.exhausted and len(rendered) < limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1):
+            self.rendered.pop(page)
+
+        return rendered
+
+    async def start(self) -> bool:
+        """Fetch the first page, returning whether there are any options at all."""
+        exists = await self.load(0)
+        self.set_menu_options(0)
+        return exists
+
+    @discord.ui.button(label="Next", row=4)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """Move to the next page, fetching it if necessary."""
+        if not ((menus := self.get_menus()) and (options := menus[0].options)):
+            return await interaction.response.defer()
+
+        block = limits.SELECT_OPTIONS * (limits.VIEW_ITEMS_PER_ROW - 1)
+        page = (int(options[0].value) // block) + 1
+
+        if not await self.load(page):
+            return await interaction.response.defer()
+
+        self.set_menu_options(page)
         await interaction.response.edit_message(view=self)
+
+class Stateless(discord.ui.DynamicItem[discord.ui.Button], abc.ABC, template=STATELESS_TEMPLATE):
+    """A button that keeps its state in its custom ID, so it costs no memory and survives restarts."""
+    prefix: typing.ClassVar[str]
+    version: typing.ClassVar[int]
+
+    def __init_subclass__(cls, *, prefix: str, version: int):
+        # Any version is matched so that subclasses can decide what to do with old buttons.
+        super().__init_subclass__(template=STATELESS_TEMPLATE.replace("[^:]+", re.escape(prefix), 1))
+        cls.prefix = prefix
+        cls.version = version
+
+    @classmethod
+    def encode(cls, *fields: object) -> str:
+        """Pack some fields (which mustn't contain ":") into a versioned custom ID."""
+        identifier = ":".join((cls.prefix, str(cls.version), *map(str, fields)))
+
+        if len(identifier) > limits.CUSTOM_ID:
+            raise ValueError(f"custom ID {identifier!r} is too long")
+
+        return identifier
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Item, match: re.Match[str], /) -> typing.Self:
+        """Called by discord.py to rebuild the button when it's pressed."""
+        button = typing.cast(discord.ui.Button, item)
+        return await cls.restore(interaction, button, int(match["version"]), match["state"].split(":"))
+
+    @classmethod
+    @abc.abstractmethod
+    async def restore(cls, interaction: discord.Interaction, button: discord.ui.Button, version: int, fields: list[str]) -> typing.Self:
+        """Rebuild the button from the fields of its custom ID."""
@@ -2,12 +2,61 @@ import wolfram.types as types
 
 import urllib.parse
 import dataclasses
+import collections
 import titlecase
 import multidict
+import database
+import datetime
 import keychain
-import aiohttp
+import network
+import asyncpg
 import hashlib
+import asyncio
+import logging
+import caches
+import typing
 import yarl
+import re
+
+# How long answers are cached for, by the first pattern that matches the query. Image
+# URLs are only hosted temporarily, so even timeless answers can't be kept forever.
+LIFETIMES = (
+    (re.compile(r"\b(weather|forecast|temperature|time|now|today|tonight|tomorrow|current|latest|price|stock|exchange rate|news)\b", re.I), 10 * 60),
+    (re.compile(r"\b(population|gdp|age|president|prime minister|ceo|record)\b", re.I), 2 * 60 * 60)
+)
+
+DEFAULT_LIFETIME = 6 * 60 * 60
+
+# Answers are kept in memory in front of the database table.
+ANSWERS = caches.LRU[str, list["Pod"]](256)
+ANSWER_FLIGHTS = caches.Flights[str, list["Pod"]]()
+
+# Answers whose slow pods are still arriving (or failed to) are shared until they're complete.
+PENDING_LIFETIME = 10 * 60
+PENDING = caches.LRU[str, list["Pod"]](256, lifetime=PENDING_LIFETIME)
+
+# Buttons only carry the digest of their parameters, so the parameters
+# are kept (in memory, in front of the database) for as long as they might be pressed.
+QUERY_LIFETIME = 7 * 24 * 60 * 60
+QUERIES = caches.LRU[str, multidict.MultiDict](1024, lifetime=QUERY_LIFETIME)
+
+# Hits are API calls saved, whichever tier served them.
+STATISTICS = caches.statistics("wolfram")
+
+# Slow pods are returned as URLs to fetch later instead of holding up the whole query.
+ASYNC_TIMEOUT = "2"
+POD_FLIGHTS = caches.Flights[str, "Pod"]()
+
+# The most popular states of an opened pod are fetched before they're clicked. Speculation
+# is limited per query and globally so it can't eat the API quota (a budget of 0 disables it).
+SPECULATION_BUDGET = 3
+SPECULATION_CONCURRENCY = 2
+SPECULATION_STATISTICS = caches.statistics("wolfram_speculation")
+SPECULATED = caches.LRU[str, bool](1024)
+SPECULATIONS: set[asyncio.Task] = set()
+POPULARITY = collections.Counter[str]()
+
+LOGGER = logging.getLogger(f"bakerbot.{__package__}")
 
 class Error(Exception):
     """Wolfram|Alpha returned an error."""
@@ -31,6 +80,12 @@ class Pod:
     pictures: list[str]
     states: list[State]
 
+    # The URL of the pod's contents, if it was still being computed.
+    pending: str | None = None
+
+    # Whether fetching the pod's contents from that URL failed.
+    failed: bool = False
+
 @dataclasses.dataclass
 class Response:
     """Answers from Wolfram|Alpha."""
@@ -45,6 +100,42 @@ def digest(parameters: multidict.MultiDict) -> str:
     signature = hashlib.md5(data.encode())
     return signature.hexdigest().upper()
 
+def lifetime(query: str) -> int:
+    """How long the answer to a query should be cached for, in seconds."""
+    for pattern, seconds in LIFETIMES:
+        if pattern.search(query):
+            return seconds
+
+    return DEFAULT_LIFETIME
+
+def dump(pods: list[Pod]) -> list[dict]:
+    """Convert pods into something that can be stored as JSON."""
+    return [dataclasses.asdict(pod) for pod in pods]
+
+def load(pods: list[dict]) -> list[Pod]:
+    """Convert stored JSON back into pods."""
+    return [
+        Pod(pod["id"], pod["title"], pod["pictures"], [State(**state) for state in pod["states"]])
+        for pod in pods
+    ]
+
+def convert(pod: types.Pod) -> Pod:
+    """Convert a pod from the API into a capsule."""
+    return Pod(
+        pod["id"],
+        titlecase.titlecase(pod["title"]),
+        [subpod["img"]["src"] for subpod in pod.get("subpods") or [] if "img" in subpod],
+
+        [
+            State(titlecase.titlecase(substate["name"]), substate["input"]) # type: ignore
+            for state in (pod.get("states") or [])
+            for substate in (state.get("states") or [state])
+        ],
+
+        # "async" can't be declared as a TypedDict key.
+        pod.get("async") if not pod.get("subpods") else None # type: ignore
+    )
+
 def parse(payload: types.Payload) -> list[Pod]:
     """Parse a payload into a list of capsules."""
     result = payload["queryresult"]
@@ -53,23 +144,9 @@ def parse(payload: types.Payload) -> list[Pod]:
         reason = result["error"]["msg"]
         raise Error(reason)
 
-    return [
-        Pod(
-            pod["id"],
-            titlecase.titlecase(pod["title"]),
-            [subpod["img"]["src"] for subpod in pod.get("subpods") or [] if "img" in subpod],
-
-            [
-                State(titlecase.titlecase(substate["name"]), substate["input"]) # type: ignore
-                for state in (pod.get("states") or [])
-                for substate in (state.get("states") or [state])
-            ]
-        )
-
-        for pod in result.get("pods") or []
-    ]
+    return [convert(pod) for pod in result.get("pods") or []]
 
-async def request(session: aiohttp.ClientSession, parameters: multidict.MultiDict) -> types.Payload:
+async def request(client: network.Client, parameters: multidict.MultiDict) -> types.Payload:
     """Send a request to the Wolfram|Alpha API."""
     signed = multidict.MultiDict(parameters, sig=digest(parameters))
 
@@ -78,10 +155,180 @@ async def request(session: aiohttp.ClientSession, parameters: multidict.MultiDic
     query = urllib.parse.urlencode(signed, quote_via=urllib.parse.quote_plus)
     url = yarl.URL(f"https://api.wolframalpha.com/v2/query.jsp?{query}", encoded=True)
 
-    async with session.get(url) as response:
+    async with client.get(url) as response:
         return await response.json()
 
-async def ask(session: aiohttp.ClientSession, query: str) -> Response:
+async def answer(client: network.Client, pool: asyncpg.Pool, parameters: multidict.MultiDict) -> list[Pod]:
+    """Get the pods for a set of parameters, from the cache if they've been requested recently."""
+    key = digest(parameters)
+
+    if (pods := ANSWERS.get(key)) is not None:
+        STATISTICS.hits += 1
+        return pods
+
+    if (pods := PENDING.get(key)) is not None:
+        return pods
+
+    return await ANSWER_FLIGHTS.run(key, lambda: fetch(client, pool, key, parameters))
+
+async def fetch(client: network.Client, pool: asyncpg.Pool, key: str, parameters: multidict.MultiDict) -> list[Pod]:
+    """Read the pods for a set of parameters from the database, or failing that, the API."""
+    if (stored := await database.WolframAnswer.read(pool, key)) is not None:
+        STATISTICS.hits += 1
+        pods = load(stored.pods)
+        remaining = (stored.expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        ANSWERS.put(key, pods, remaining)
+        return pods
+
+    STATISTICS.misses += 1
+    pods = parse(await request(client, parameters))
+
+    # Incomplete answers are remembered once `complete` has filled them in.
+    if not any(pod.pending for pod in pods):
+        await remember(pool, key, parameters["input"], pods)
+    else:
+        PENDING[key] = pods
+
+    return pods
+
+async def remember(pool: asyncpg.Pool, key: str, query: str, pods: list[Pod]):
+    """Cache a complete answer in memory and in the database."""
+    seconds = lifetime(query)
+    expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+
+    ANSWERS.put(key, pods, seconds)
+    PENDING.pop(key)
+    await database.WolframAnswer(key, dump(pods), expiry).write(pool)
+
+async def store(pool: asyncpg.Pool, parameters: multidict.MultiDict) -> str:
+    """Keep a set of parameters so that it can be recalled by its digest, which is returned."""
+    if (key := digest(parameters)) not in QUERIES:
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=QUERY_LIFETIME)
+        QUERIES[key] = parameters
+
+        # The application ID is added back when the parameters are recalled.
+        pairs = [[name, value] for name, value in parameters.items() if name != "appid"]
+        await database.WolframQuery(key, pairs, expiry).write(pool)
+
+    return key
+
+async def recall(pool: asyncpg.Pool, key: str) -> multidict.MultiDict | None:
+    """Look up a set of parameters by its digest, if it hasn't expired."""
+    if (parameters := QUERIES.get(key)) is None:
+        if (stored := await database.WolframQuery.read(pool, key)) is None:
+            return None
+
+        parameters = multidict.MultiDict(stored.parameters, appid=keychain.WOLFRAM_ID)
+        QUERIES[key] = parameters
+
+    return parameters
+
+async def resolve(client: network.Client, url: str) -> Pod:
+    """Request the contents of a pod that was still being computed."""
+    async with client.get(yarl.URL(url, encoded=True)) as response:
+        payload = await response.json()
+
+    # Async pod URLs answer with a query result holding just that pod.
+    pods = payload["queryresult"]["pods"] if "queryresult" in payload else [payload]
+    return convert(pods[0])
+
+async def complete(client: network.Client, pool: asyncpg.Pool, parameters: multidict.MultiDict, pods: list[Pod]) -> typing.AsyncIterator[tuple[int, Pod]]:
+    """Fill in pods that were still being computed, yielding each one as it arrives (or fails)."""
+    # The parameters are captured now since views change them between requests.
+    key, query = digest(parameters), parameters["input"]
+    tasks = {
+        asyncio.ensure_future(POD_FLIGHTS.run(url, lambda url=url: resolve(client, url))): index
+        for index, pod in enumerate(pods) if (url := pod.pending) is not None
+    }
+
+    if not tasks:
+        return
+
+    failed = False
+
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                index = tasks.pop(task)
+
+                try:
+                    pods[index] = task.result()
+                except Exception as error:
+                    LOGGER.warning(f"Failed to fetch the {pods[index].title} pod: {error}")
+                    pods[index].failed = failed = True
+
+                yield index, pods[index]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not failed:
+        await remember(pool, key, query, pods)
+
+def expand(parameters: multidict.MultiDict, pod: str, state: str) -> multidict.MultiDict:
+    """Build the parameters that request a single pod in another state."""
+    expanded = multidict.MultiDict(parameters)
+    expanded["includepodid"] = pod
+    expanded.add("podstate", state)
+    return expanded
+
+def root(parameters: multidict.MultiDict) -> multidict.MultiDict:
+    """Strip the pod and states out of a set of parameters, leaving the original query."""
+    stripped = multidict.MultiDict(parameters)
+    stripped.popall("includepodid", None)
+    stripped.popall("podstate", None)
+    return stripped
+
+def observe(parameters: multidict.MultiDict, state: str):
+    """Record that a state was requested, and whether it had already been speculatively fetched."""
+    POPULARITY[state] += 1
+    key = digest(parameters)
+
+    # Speculation only saved anything if the whole answer made it into the cache.
+    if SPECULATION_BUDGET > 0:
+        if SPECULATED.pop(key) is not None and key in ANSWERS:
+            SPECULATION_STATISTICS.hits += 1
+        else:
+            SPECULATION_STATISTICS.misses += 1
+
+def speculate(client: network.Client, pool: asyncpg.Pool, parameters: multidict.MultiDict, pod: Pod, budget: int) -> int:
+    """Fetch the most popular states of a pod in the background, returning how many were started."""
+    started = 0
+
+    for state in sorted(pod.states, key=lambda state: -POPULARITY[state.input]):
+        if started >= budget or len(SPECULATIONS) >= SPECULATION_CONCURRENCY:
+            break
+
+        expanded = expand(parameters, pod.id, state.input)
+
+        if (key := digest(expanded)) in ANSWERS or key in SPECULATED:
+            continue
+
+        SPECULATED[key] = True
+        task = asyncio.create_task(prefetch(client, pool, expanded))
+        task.add_done_callback(SPECULATIONS.discard)
+        SPECULATIONS.add(task)
+        started += 1
+
+    return started
+
+async def prefetch(client: network.Client, pool: asyncpg.Pool, parameters: multidict.MultiDict):
+    """Fetch an answer so that it's already cached when it's asked for."""
+    try:
+        pods = await answer(client, pool, parameters)
+
+        async for _ in complete(client, pool, parameters, pods):
+            pass
+    except Exception as error:
+        LOGGER.warning(f"Failed to speculatively fetch a pod state: {error}")
+
+    # Failed speculations can be tried again the next time the pod is opened.
+    if (key := digest(parameters)) not in ANSWERS:
+        SPECULATED.pop(key)
+
+async def ask(client: network.Client, pool: asyncpg.Pool, query: str) -> Response:
     """Query Wolfram|Alpha."""
     parameters = multidict.MultiDict(
         appid=keychain.WOLFRAM_ID,
@@ -93,5 +340,7 @@ async def ask(session: aiohttp.ClientSession, query: str) -> Response:
         input=query
     )
 
-    payload = await request(session, parameters)
-    return Response(parameters, parse(payload))
+    # This one is a keyword, so it can't be passed above.
+    parameters.add("async", ASYNC_TIMEOUT)
+    await store(pool, parameters)
+    return Response(parameters, await answer(client, pool, parameters))
@@ -2,114 +2,193 @@ import discord.app_commands as application
 import discord.ext.commands as commands
 import wolfram.backend as backend
 
+import multidict
 import discord
-import aiohttp
 import colours
+import caches
 import limits
+import typing
 import views
 import bot
 
+# The rest of each query's speculation budget, by the digest of its parameters.
+BUDGETS = caches.LRU[str, int](256)
+
+# Messages still showing pod buttons, which are re-rendered as slow pods arrive.
+BROWSING = caches.LRU[int, bool](256)
+
 class Wolfram(commands.Cog):
     def __init__(self, bot: bot.Bot):
         self.bot = bot
 
+    async def cog_load(self):
+        """Handle pod buttons."""
+        self.bot.add_dynamic_items(PodButton)
+
+    async def cog_unload(self):
+        """Stop handling pod buttons."""
+        self.bot.remove_dynamic_items(PodButton)
+
     @application.command(description="Ask Wolfram|Alpha something.")
     @application.describe(query="Enter what you want to calculate or know about.")
     async def wolfram(self, interaction: discord.Interaction, query: str):
         await interaction.response.defer(thinking=True)
 
         try:
-            response = await backend.ask(self.bot.session, query)
+            response = await backend.ask(self.bot.network, self.bot.pool, query)
         except backend.Error as error:
             message = f"An unexpected error was returned: {error.reason}"
             return await interaction.followup.send(message)
 
         if response.pods:
-            view = View(self.bot.session, response)
-            await interaction.followup.send(view=view)
+            key = backend.digest(response.parameters)
+            message = await interaction.followup.send(view=Browser(key, response.pods), wait=True)
+            BROWSING[message.id] = True
+            await stream(interaction, self.bot, message.id, response.parameters, response.pods)
         else:
             content = "Wolfram|Alpha was unable to answer your query."
             await interaction.followup.send(content=content)
 
-class View(views.View):
-    """An interactive view for Wolfram|Alpha queries."""
-    def __init__(self, session: aiohttp.ClientSession, response: backend.Response):
-        super().__init__()
-        self.session = session
-        self.parameters = response.parameters
-        self.pods = response.pods
-
-        self.add_pod_buttons()
-
-    def add_pod_buttons(self):
-        """Add buttons for each pod to the view."""
-        for index, pod in enumerate(self.pods):
-            button = discord.ui.Button(label=pod.title, custom_id=self.stringify(index))
-            button.callback = self.select
-            self.add_item(button)
-
-    def add_state_buttons(self, pod: backend.Pod):
-        """Add buttons for each state in a pod to the view."""
-        button = discord.ui.Button(label="Back", custom_id=self.stringify(pod.id))
-        button.callback = self.reset
-        self.add_item(button)
-
-        for state in pod.states:
-            button = discord.ui.Button(label=state.name, custom_id=self.stringify(state.input))
-            button.callback = self.update
-            self.add_item(button)
-
-    async def reset(self, interaction: discord.Interaction):
-        """Return the view to the pod preview state."""
-        self.clear_items()
-        self.add_pod_buttons()
-        self.parameters.popall("includepodid", None)
-        self.parameters.popall("podstate", None)
-        await interaction.response.edit_message(embed=None, view=self)
-
-    async def select(self, interaction: discord.Interaction):
-        """Update the view to select a specific pod."""
-        identifier = interaction.data["custom_id"] # type: ignore
-
-        index, = self.destringify(identifier)
-        pod = self.pods[int(index)]
-
-        self.clear_items()
-        self.add_state_buttons(pod)
-
-        embed = discord.Embed(colour=colours.REGULAR)
-        embeds = [embed.copy().set_image(url=url) for url in pod.pictures]
-        embeds[0].title = pod.title
-
-        await interaction.response.edit_message(embeds=embeds[:limits.MESSAGE_EMBEDS], view=self)
-
-    async def update(self, interaction: discord.Interaction):
-        """Update the view by requesting more information from Wolfram|Alpha."""
-        # This is an extremely cursed system, but whatever.
-        # The pod identifier is encoded in the identifier of the Back button.
-        # The state input is encoded in the identifier of the just-pressed button.
-        # The type checker goes insane if I don't tell it to ignore what's happening here.
-        back = self.children[0].custom_id # type: ignore
-        identifier = interaction.data["custom_id"] # type: ignore
-
-        pod, = self.destringify(back)
-        state, = self.destringify(identifier)
-        self.parameters["includepodid"] = pod
-        self.parameters.add("podstate", state)
-
-        self.clear_items()
-        self.add_item(discord.ui.Button(label="Please wait while another request is made.", disabled=True))
-        await interaction.response.edit_message(view=self)
-
-        # We specified that only one capsule should be returned.
-        response = await backend.request(self.session, self.parameters)
-        pod, = backend.parse(response)
-
-        self.clear_items()
-        self.add_state_buttons(pod)
-
-        embed = discord.Embed(colour=colours.REGULAR)
-        embeds = [embed.copy().set_image(url=url) for url in pod.pictures]
-        embeds[0].title = pod.title
-
-        await interaction.edit_original_response(embeds=embeds[:limits.MESSAGE_EMBEDS], view=self)
+async def stream(interaction: discord.Interaction, client: bot.Bot, message: int, parameters: multidict.MultiDict, pods: list[backend.Pod]):
+    """Fill in slow pods, re-rendering the pod buttons as each one arrives (while they're showing)."""
+    key = backend.digest(parameters)
+
+    async for _ in backend.complete(client.network, client.pool, parameters, pods):
+        if BROWSING.get(message):
+            await interaction.edit_original_response(view=Browser(key, pods))
+
+def show(pod: backend.Pod) -> list[discord.Embed]:
+    """Build the embeds that display a pod."""
+    if not pod.pictures:
+        description = "Wolfram|Alpha was unable to show this pod."
+        return [discord.Embed(title=pod.title, description=description, colour=colours.FAILURE)]
+
+    embed = discord.Embed(colour=colours.REGULAR)
+    embeds = [embed.copy().set_image(url=url) for url in pod.pictures]
+    embeds[0].title = pod.title
+    return embeds[:limits.MESSAGE_EMBEDS]
+
+class Browser(views.View):
+    """Buttons for each pod of an answer, built with stateless Discord components."""
+    def __init__(self, key: str, pods: list[backend.Pod]):
+        # Every button carries the digest of its query, so nothing needs to be kept around.
+        super().__init__(timeout=None)
+
+        for index, pod in enumerate(pods):
+            # Pods that are still being computed can't be opened yet, but ones that failed can be retried.
+            status = " (Retry)" if pod.failed else " (Loading)" if pod.pending else ""
+            self.add_item(PodButton(f"{pod.title}{status}", pod.pending is not None and not pod.failed, "p", key, index))
+
+class Viewer(views.View):
+    """A pod's Back button and buttons for each of its states, built with stateless Discord components."""
+    def __init__(self, query: str, key: str, index: int, pod: backend.Pod):
+        super().__init__(timeout=None)
+        self.add_item(PodButton("Back", False, "b", query, 0))
+
+        for number, state in enumerate(pod.states):
+            self.add_item(PodButton(state.name, False, "s", key, index, number))
+
+class PodButton(views.Stateless, prefix="wa", version=1):
+    """A button that leads to a pod (or one of its states) of a Wolfram|Alpha answer."""
+    def __init__(self, label: str, disabled: bool, action: str, key: str, index: int, state: int = 0):
+        # The key is the digest of the parameters that `index` (and `state`) refer to the answer of.
+        button = discord.ui.Button(label=limits.limit(label, limits.BUTTON_LABEL), disabled=disabled, custom_id=self.encode(action, key, index, state))
+        super().__init__(button)
+
+        self.action = action
+        self.key = key
+        self.index = index
+        self.state = state
+
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, button: discord.ui.Button, version: int, fields: list[str]) -> "PodButton":
+        """Rebuild the button from the fields of its custom ID."""
+        if version != cls.version:
+            raise ValueError(f"unsupported pod button version {version}")
+
+        action, key, index, state = fields
+        return cls(button.label or "", button.disabled, action, key, int(index), int(state))
+
+    async def callback(self, interaction: discord.Interaction):
+        """Show whatever this button leads to."""
+        client = typing.cast(bot.Bot, interaction.client)
+
+        # The answer might have to be requested again, which can take longer than Discord waits for.
+        await interaction.response.defer()
+        parameters = await backend.recall(client.pool, self.key)
+
+        try:
+            pods = await backend.answer(client.network, client.pool, parameters) if parameters is not None else []
+        except backend.Error:
+            pods = []
+
+        if self.index >= len(pods):
+            return await interaction.followup.send("This answer has expired, so please ask again.", ephemeral=True)
+
+        parameters = typing.cast(multidict.MultiDict, parameters)
+        message = typing.cast(discord.Message, interaction.message)
+
+        if self.action == "b":
+            BROWSING[message.id] = True
+            await interaction.edit_original_response(embed=None, view=Browser(self.key, pods))
+
+            # A refetched answer may have slow pods of its own.
+            await stream(interaction, client, message.id, parameters, pods)
+        elif self.action == "p" and pods[self.index].pending is not None:
+            await self.retry(interaction, client, parameters, pods)
+        elif self.action == "p":
+            BROWSING.pop(message.id)
+            pod = pods[self.index]
+            await interaction.edit_original_response(embeds=show(pod), view=Viewer(self.key, self.key, self.index, pod))
+            speculate(client, parameters, pod)
+        else:
+            await self.update(interaction, client, parameters, pods[self.index])
+
+    async def retry(self, interaction: discord.Interaction, client: bot.Bot, parameters: multidict.MultiDict, pods: list[backend.Pod]):
+        """Try fetching the contents of pods that haven't arrived (or failed to) again."""
+        message = typing.cast(discord.Message, interaction.message)
+
+        for pod in pods:
+            pod.failed = False
+
+        BROWSING[message.id] = True
+        await interaction.edit_original_response(embed=None, view=Browser(self.key, pods))
+        await stream(interaction, client, message.id, parameters, pods)
+
+    async def update(self, interaction: discord.Interaction, client: bot.Bot, parameters: multidict.MultiDict, original: backend.Pod):
+        """Show a pod in another state by requesting more information from Wolfram|Alpha."""
+        if self.state >= len(original.states):
+            return await interaction.followup.send("This answer has expired, so please ask again.", ephemeral=True)
+
+        state = original.states[self.state].input
+        expanded = backend.expand(parameters, original.id, state)
+        key = await backend.store(client.pool, expanded)
+        query = backend.digest(backend.root(parameters))
+        backend.observe(expanded, state)
+
+        waiting = views.View(timeout=None)
+        waiting.add_item(discord.ui.Button(label="Please wait while another request is made.", disabled=True))
+        await interaction.edit_original_response(view=waiting)
+
+        try:
+            pods = await backend.answer(client.network, client.pool, expanded)
+
+            async for _ in backend.complete(client.network, client.pool, expanded, pods):
+                pass
+        except backend.Error:
+            pods = []
+
+        # We specified that only one capsule should be returned, but it may not have arrived.
+        if pods and not pods[0].failed:
+            pod = pods[0]
+            await interaction.edit_original_response(embeds=show(pod), view=Viewer(query, key, 0, pod))
+            speculate(client, expanded, pod)
+        else:
+            pod = backend.Pod(original.id, original.title, [], original.states)
+            await interaction.edit_original_response(embeds=show(pod), view=Viewer(query, self.key, self.index, original))
+
+def speculate(client: bot.Bot, parameters: multidict.MultiDict, pod: backend.Pod):
+    """Speculatively fetch the states of a pod, out of the budget of the query it belongs to."""
+    query = backend.digest(backend.root(parameters))
+    budget = BUDGETS.get(query, backend.SPECULATION_BUDGET)
+    BUDGETS[query] = budget - backend.speculate(client.network, client.pool, parameters, pod, budget)